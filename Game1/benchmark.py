@@ -0,0 +1,53 @@
+import random
+import sys
+
+import pymunk
+from engine.physics import PhysicsWorld
+
+
+# Compares Chipmunk's BB trees with the spatial hash on synthetic side-scroller
+# levels: a long row of unit tiles at a few heights, with balls dropped on it.
+# Usage: python3 benchmark.py [steps]
+
+LEVELS = [
+    # name, tiles, balls
+    ('small', 500, 50),
+    ('long', 5000, 200),
+    ('crowded', 5000, 2000),
+]
+
+
+def build(tiles, balls, seed=1):
+    world = PhysicsWorld()
+    rng = random.Random(seed)
+    for i in range(tiles):
+        body = pymunk.Body()
+        body.position = i, rng.choice((0, 0, 0, 3, 6))
+        world.add(pymunk.Poly.create_box(body, (1, 1)))
+    for _ in range(balls):
+        body = pymunk.Body(1, 10)
+        body.position = rng.uniform(0, tiles), rng.uniform(8, 20)
+        world.add(body, pymunk.Circle(body, 0.5))
+    # Let the balls land first
+    for _ in range(180):
+        world.step(1 / 60)
+    return world
+
+
+def run(steps):
+    print('%-8s %6s %9s %9s %6s %5s' % ('level', 'shapes', 'tree ms',
+                                        'hash ms', 'cell', 'auto'))
+    for name, tiles, balls in LEVELS:
+        tree = build(tiles, balls)
+        spatial = build(tiles, balls)
+        spatial.use_spatial_hash()
+        times = [PhysicsWorld.time_steps(world.space, steps) * 1000 / steps
+                 for world in (tree, spatial)]
+        auto = build(tiles, balls).tune_broadphase()
+        print('%-8s %6d %9.3f %9.3f %6.2f %5s' % (
+            name, tiles + balls, times[0], times[1], spatial.hash_size[0],
+            auto))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -1,4 +1,8 @@
 import sys
+import time
+import weakref
+from collections import defaultdict
+from itertools import count
 
 import pygame
 
@@ -7,45 +11,163 @@ import pymunk as pm
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+from .backend import GLBackend, NullBackend, RenderBackend
+from .batching import StaticBatch
+from .commands import Commands
 from .components import *
+from .culling import Culling, Frustum
+from .ecs import ArrayComponent, ECS
+from .glstate import GLState
 from .input_manager import Input
-from .physics import BoxCollider, SphereCollider, Physics, Rigidbody
+from .instancing import Instancer
+from .lod import LodSelector
+from .physics import BoxCollider, SphereCollider, Collisions, Hit, \
+    Interpolation, Physics, PhysicsWorld, Rigidbody
+from .pipeline import PhysicsPipeline
+from .pool import Pool
+from .render_queue import RenderQueue
+from .simulation import simulate_many
+from .snapshot import Snapshot
+from .transforms import TransformPass
 
 
 class GameObject(object):
     instances = []
+    # Dicts keyed by GameObject, used as insertion-ordered sets
+    tagged = defaultdict(dict)
+    having = defaultdict(dict)
+    updating = {}
+    handles = {}
+    serial = count(1)
+    pool = None
+    # Set once a snapshot is taken: removed objects are then only deactivated,
+    # so that restoring the snapshot can bring them back
+    retain = False
+    # Frees the transform row of a retained object once it is collected
+    _finalizer = None
     
     def __init__(self, x=0, y=0, z=0, scale=(1, 1, 1)):
         self._body = pm.Body()
         self._body.position = x, y
         self._shape = None
-        self._ax = 0
-        self._ay = 0
-        self._z = z
-        self.tag = ''
-        self.scale = scale
+        self.world = Physics.world
+        self._row = None
+        if ECS.enabled:
+            self._row = ECS.transforms.add(z, scale)
+        else:
+            self._ax = 0
+            self._ay = 0
+            self._z = z
+            self._scale = scale
+        self._tag = ''
         self.components = []
+        self.by_type = {}
+        # Only the components that override the hook
+        self.updaters = []
+        self.colliders = []
+        self.batch_colliders = []
+        self.renderers = []
+        # (cube, batch) pairs taken out of a StaticBatch while inactive
+        self._batched = []
+        self.alive = True
+        self.active = True
+        # Handles are never reused; get() returns None once the object is gone
+        self.handle = next(GameObject.serial)
+        GameObject.handles[self.handle] = self
+        self._index = len(GameObject.instances)
         GameObject.instances.append(self)
 
     @property
     def position(self):
         pos = self._body.position
-        return pos.x, pos.y, self._z
+        if self._row is None:
+            return pos.x, pos.y, self._z
+        return pos.x, pos.y, ECS.transforms.z[self._row]
 
     @position.setter
     def position(self, pos):
         self._body.position = pos[0], pos[1]
-        self._z = pos[2]
+        self.wake()
+        if self._row is None:
+            self._z = pos[2]
+        else:
+            ECS.transforms.z[self._row] = pos[2]
+        if Culling.instance is not None:
+            Culling.instance.move(self)
+        self._restage()
 
     @property
     def rotation(self):
-        return self._ax, self._ay, self._body.angle
+        if self._row is None:
+            return self._ax, self._ay, self._body.angle
+        ax, ay = ECS.transforms.rotation[self._row]
+        return ax, ay, self._body.angle
 
     @rotation.setter
     def rotation(self, rot):
-        self._ax = rot[0]
-        self._ay = rot[1]
+        if self._row is None:
+            self._ax = rot[0]
+            self._ay = rot[1]
+        else:
+            ECS.transforms.rotation[self._row] = rot[:2]
         self._body.angle = rot[2]
+        self._restage()
+
+    @property
+    def scale(self):
+        if self._row is None:
+            return self._scale
+        return tuple(ECS.transforms.scale[self._row])
+
+    @scale.setter
+    def scale(self, scale):
+        if self._row is None:
+            self._scale = scale
+        else:
+            ECS.transforms.scale[self._row] = scale
+        self._restage()
+
+    def _restage(self):
+        # Batched geometry is baked in at upload; have it rebuilt
+        for component in self.renderers:
+            batch = getattr(component, 'batch', None)
+            if batch is not None:
+                batch.dirty = True
+
+    @property
+    def tag(self):
+        return self._tag
+
+    @tag.setter
+    def tag(self, tag):
+        self._untag()
+        self._tag = tag
+        if tag:
+            GameObject.tagged[tag][self] = None
+
+    def _untag(self):
+        bucket = GameObject.tagged.get(self._tag)
+        if bucket is not None:
+            bucket.pop(self, None)
+            if not bucket:
+                del GameObject.tagged[self._tag]
+
+    @classmethod
+    def get(cls, handle):
+        return cls.handles.get(handle)
+
+    @classmethod
+    def find_with_tag(cls, tag):
+        return list(cls.tagged.get(tag, ()))
+
+    @classmethod
+    def find_with_components(cls, *types):
+        if not types:
+            return []
+        buckets = sorted((cls.having.get(t, {}) for t in types), key=len)
+        smallest, rest = buckets[0], buckets[1:]
+        return [gameobject for gameobject in smallest
+                if all(gameobject in bucket for bucket in rest)]
 
     @property
     def velocity(self):
@@ -54,12 +176,25 @@ class GameObject(object):
     @velocity.setter
     def velocity(self, vel):
         self._body.velocity = vel
+        self.wake()
+
+    # Sleeping objects are left out of the update loop, and Chipmunk reports
+    # no new contacts between them, until something touches or moves them
+    @property
+    def sleeping(self):
+        return bool(self._body.is_sleeping)
+
+    def wake(self):
+        if not self._body.is_static:
+            self._body.activate()
 
     def move(self, x, y):
         self._body.apply_impulse((x, y))
+        self.wake()
 
     def apply_force(self, x, y):
         self._body.apply_force((x, y))
+        self.wake()
 
     def add_components(self, *components):
         for component in components:
@@ -68,85 +203,387 @@ class GameObject(object):
     def add_component(self, component):
         self.components.append(component)
         component.gameobject = self
+        self.wake()
+        # Indexed under every base class, so lookups by a base type work too
+        for cls in type(component).__mro__[:-1]:
+            found = self.by_type.setdefault(cls, [])
+            if not found:
+                GameObject.having[cls][self] = None
+            found.append(component)
         component.start()
+        if self._row is not None and isinstance(component, ArrayComponent):
+            ECS.add(component)
+        # Components with an ECS row are updated by their system
+        if component._row is None and component.overrides('update'):
+            self.updaters.append(component)
+            GameObject.updating[self] = None
+        if component.overrides('on_collide'):
+            self.colliders.append(component)
+        if component.overrides('on_collisions'):
+            self.batch_colliders.append(component)
+        if self._shape is not None and (component in self.colliders or
+                                        component in self.batch_colliders):
+            self.world.listen(self._shape.collision_type,
+                              component.collides_with)
+        if isinstance(component, Renderable):
+            self.renderers.append(component)
+        if isinstance(component, Renderable) and Culling.instance is not None:
+            Culling.instance.add(component)
 
     def get_component_by_type(self, cls):
-        for component in self.components:
-            if isinstance(component, cls):
-                return component
+        found = self.by_type.get(cls)
+        if found:
+            return found[0]
+
+    def get_components_by_type(self, cls):
+        return list(self.by_type.get(cls, ()))
 
     def remove_component(self, component):
         component.stop()
         self.components.remove(component)
+        for cls in type(component).__mro__[:-1]:
+            found = self.by_type[cls]
+            found.remove(component)
+            if not found:
+                del self.by_type[cls]
+                bucket = GameObject.having[cls]
+                del bucket[self]
+                if not bucket:
+                    del GameObject.having[cls]
+        if component._row is not None:
+            ECS.remove(component)
+        if component in self.updaters:
+            self.updaters.remove(component)
+            if not self.updaters:
+                del GameObject.updating[self]
+        if component in self.colliders:
+            self.colliders.remove(component)
+        if component in self.batch_colliders:
+            self.batch_colliders.remove(component)
+        if component in self.renderers:
+            self.renderers.remove(component)
+        if isinstance(component, Renderable) and Culling.instance is not None:
+            Culling.instance.discard(component)
 
     def render(self):
-        for component in self.components:
-            if isinstance(component, Renderable):
-                component.render()
+        for component in self.renderers:
+            component.render()
 
     def update(self, dt):
-        for component in self.components:
+        for component in self.updaters:
             component.update(dt)
 
-    def remove(self):
+    def despawn(self):
+        Commands.despawn(self)
+
+    def reset(self, x=0, y=0, z=0):
+        body = self._body
+        body.reset_forces()
+        body.velocity = 0, 0
+        body.angular_velocity = 0
+        self.rotation = 0, 0, 0
+        self.position = x, y, z
+
+    def _physics_objects(self):
+        if self._shape is None:
+            return ()
+        if self._body.is_static:
+            return self._shape,
+        return self._body, self._shape
+
+    def _unlist(self):
+        # Move the last object into our slot
+        instances = GameObject.instances
+        last = instances.pop()
+        if last is not self:
+            instances[self._index] = last
+            last._index = self._index
+
+    def deactivate(self):
+        self.active = False
+        self.world.remove(*self._physics_objects())
         for component in self.components:
+            if component._row is not None:
+                ECS.remove(component)
+            if isinstance(component, Renderable) and \
+                    Culling.instance is not None:
+                Culling.instance.discard(component)
+            batch = getattr(component, 'batch', None)
+            if batch is not None:
+                batch.discard(component)
+                self._batched.append((component, batch))
+        for cls in self.by_type:
+            del GameObject.having[cls][self]
+        GameObject.updating.pop(self, None)
+        self._untag()
+        self._unlist()
+
+    def activate(self):
+        self.active = True
+        self._index = len(GameObject.instances)
+        GameObject.instances.append(self)
+        self.tag = self._tag
+        if self.updaters:
+            GameObject.updating[self] = None
+        for cls in self.by_type:
+            GameObject.having[cls][self] = None
+        for component in self.components:
+            if self._row is not None and \
+                    isinstance(component, ArrayComponent):
+                ECS.add(component)
+            if isinstance(component, Renderable) and \
+                    Culling.instance is not None:
+                Culling.instance.add(component)
+        for cube, batch in self._batched:
+            batch.add(cube)
+        self._batched = []
+        self.world.add(*self._physics_objects())
+
+    def remove(self):
+        if self.pool is not None:
+            self.pool.release(self)
+            return
+        if not self.alive:
+            return
+        self.alive = False
+        if GameObject.retain:
+            # Freed for good once no snapshot refers to the object
+            if self.active:
+                self.deactivate()
+            del GameObject.handles[self.handle]
+            if self._row is not None:
+                self._finalizer = weakref.finalize(self, ECS.transforms.remove,
+                                                   self._row)
+            return
+        if not self.active:
+            self.activate()
+        for component in list(self.components):
             self.remove_component(component)
-        if self._shape is not None:
-            Physics.remove(self._shape)
-        GameObject.instances.remove(self)
+        self.world.remove(*self._physics_objects())
+        if self._row is not None:
+            ECS.transforms.remove(self._row)
+        self._untag()
+        del GameObject.handles[self.handle]
+        self._unlist()
+
+    def revive(self):
+        # Back from the pool or from a removal kept by GameObject.retain
+        if self.pool is not None and self in self.pool.free:
+            self.pool.free.remove(self)
+        if not self.alive:
+            self.alive = True
+            GameObject.handles[self.handle] = self
+            if self._finalizer is not None:
+                self._finalizer.detach()
+                self._finalizer = None
+        self.activate()
 
     def collide(self, other, contacts):
-        for component in self.components:
+        for component in self.colliders:
             component.on_collide(other, contacts)
 
+    def collide_batch(self, collisions):
+        for component in self.batch_colliders:
+            component.on_collisions(collisions)
+
 
 class Game(object):
-    def __init__(self, caption, width=800, height=600):
+    def __init__(self, caption, width=800, height=600, backend=None,
+                 ecs=False):
+        if ecs:
+            ECS.enable()
+        # GameObjects created from here on join this world
+        self.world = Physics.world = PhysicsWorld()
         self.caption = caption
         self.width = width
         self.height = height
         self.fps = 60
+        self.frame_limit = None
+        # Seconds per physics step, or None to step by the frame time
+        self.fixed_step = None
+        self.max_substeps = 5
+        self.accumulator = 0
+        self.interpolate = True
+        self.interpolation = Interpolation(self.world)
+        # Step physics on a worker thread while the last step is rendered
+        self.pipelined = False
+        self.pipeline = PhysicsPipeline(self.world)
         self.screen = None
+        self.backend = backend if backend is not None else GLBackend()
+        self.fov = 45
+        self.near = 1
+        self.far = 100
+        self.static_batching = True
+        self.static_batch = StaticBatch()
+        self.static_merging = True
+        # 'tree', 'hash' or 'auto' to time both on the level at setup
+        self.broadphase = 'auto'
+        self.render_queue = RenderQueue()
+        self.transform_pass = TransformPass()
+        self.instancing = False
+        self.instancer = Instancer()
+        self.frustum_culling = True
+        self.culling = Culling()
+        self.level_of_detail = True
+        self.lod = LodSelector()
 
     def mainloop(self):
         self.setup()
         clock = pygame.time.Clock()
         while not Input.quit_flag:
+            if self.backend.frames == self.frame_limit:
+                break
             dt = clock.tick(self.fps)
             dt /= 1000
-            Physics.step(dt)
-            self.update(dt)
-            self.render()
-        pygame.quit()
+            if self.pipelined:
+                self.pipelined_frame(self.fixed_step or dt)
+            elif self.fixed_step is None:
+                self.world.step(dt)
+                self.update(dt)
+                self.render()
+            else:
+                self.advance(dt)
+        self.pipeline.close()
+        self.backend.close()
         sys.exit()
 
+    def simulate(self, frames, dt=1 / 60, script=None):
+        # Headless run at a fixed dt, as fast as possible and without
+        # rendering; returns metrics() plus timing
+        self.backend = NullBackend()
+        previous = Input.script
+        Input.reset()
+        Input.script = script
+        try:
+            self.setup()
+            start = time.perf_counter()
+            frame = 0
+            while frame < frames and not Input.quit_flag:
+                self.world.step(dt)
+                self.update(dt)
+                frame += 1
+            wall_time = time.perf_counter() - start
+            metrics = self.metrics()
+            metrics.update(frames=frame, time=frame * dt, wall_time=wall_time)
+            self.backend.close()
+        finally:
+            Input.script = previous
+            Input.reset()
+        return metrics
+
+    def save(self, snapshot=None):
+        # Between frames; reuse the snapshot to keep its buffer
+        self.pipeline.wait()
+        GameObject.retain = True
+        if snapshot is None:
+            snapshot = Snapshot()
+        snapshot.save(GameObject.instances)
+        return snapshot
+
+    def restore(self, snapshot):
+        self.pipeline.wait()
+        snapshot.restore(GameObject.instances, self.world)
+
+    def metrics(self):
+        return {}
+
+    def advance(self, dt):
+        step = self.fixed_step
+        self.accumulator += dt
+        steps = 0
+        while self.accumulator >= step and steps < self.max_substeps:
+            if self.interpolate:
+                self.interpolation.record()
+            self.world.step(step)
+            self.update(step)
+            self.accumulator -= step
+            steps += 1
+        if steps == self.max_substeps:
+            # Too far behind to catch up; drop the backlog
+            self.accumulator = min(self.accumulator, step)
+        if self.interpolate:
+            self.interpolation.apply(self.accumulator / step)
+            self.render()
+            self.interpolation.restore()
+        else:
+            self.render()
+
+    def pipelined_frame(self, dt):
+        pipeline = self.pipeline
+        pipeline.wait()
+        self.update(dt)
+        pipeline.capture()
+        pipeline.start(dt)
+        pipeline.bind()
+        self.render()
+        pipeline.unbind()
+
     def setup(self):
-        pygame.init()
-        size = self.width, self.height
-        self.screen = pygame.display.set_mode(size,
-                                              pygame.OPENGL | pygame.DOUBLEBUF)
-        pygame.display.set_caption(self.caption)
-        glEnable(GL_LIGHTING)
-        glEnable(GL_COLOR_MATERIAL)
-        glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
-        glEnable(GL_DEPTH_TEST)
-        glClearColor(0.5, 0.7, 1, 1)
-        glMatrixMode(GL_PROJECTION)
-        aspect = self.width / self.height
-        gluPerspective(45, aspect, 1, 100)
-        glMatrixMode(GL_MODELVIEW)
+        RenderBackend.current = self.backend
+        self.backend.open(self)
+        GLState.reset()
+        GLState.enable(GL_LIGHTING)
+        GLState.enable(GL_COLOR_MATERIAL)
+        GLState.enable(GL_NORMALIZE)
+        GLState.enable(GL_DEPTH_TEST)
+        if self.static_batching:
+            self.batch_static_geometry()
+        if self.static_merging:
+            self.merge_static_colliders()
+        self.select_broadphase()
+
+    def batch_static_geometry(self):
+        self.static_batch.build([g for g in GameObject.instances
+                                 if g.world is self.world])
+
+    def merge_static_colliders(self):
+        # Unrotated static boxes that nothing updates can share one shape
+        self.world.merge_boxes([g._shape for g in GameObject.instances
+                                if g.world is self.world and
+                                g._body.angle == 0 and
+                                g.get_component_by_type(BoxCollider) and
+                                StaticBatch.is_static(g)])
+
+    def select_broadphase(self):
+        if self.broadphase == 'auto':
+            self.world.tune_broadphase()
+        elif self.broadphase == 'hash' and self.world.broadphase == 'tree':
+            self.world.use_spatial_hash()
 
     @staticmethod
     def update(dt):
         Input.update()
-        for gameobject in GameObject.instances:
-            gameobject.update(dt)
+        for gameobject in list(GameObject.updating):
+            if not gameobject.sleeping:
+                gameobject.update(dt)
+        if ECS.enabled:
+            ECS.run(dt)
+        Commands.flush()
 
-    @staticmethod
-    def render():
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    def frustum(self):
+        eye, target, up = Camera.instance.look_at()
+        aspect = self.width / self.height
+        return Frustum(eye, target, up, self.fov, aspect, self.near, self.far)
+
+    def renderables(self):
+        if self.frustum_culling and Camera.instance is not None:
+            return self.culling.visible(self.frustum())
+        return [component for gameobject in GameObject.instances
+                for component in gameobject.renderers]
+
+    def render(self):
+        GLState.new_frame()
+        self.backend.begin_frame()
         if Camera.instance is not None:
             Camera.instance.render()
-        for gameobject in GameObject.instances:
-            gameobject.render()
-        pygame.display.flip()
+        renderables = self.renderables()
+        if self.level_of_detail and Camera.instance is not None:
+            eye = Camera.instance.look_at()[0]
+            self.lod.update(renderables, eye, self.fov, self.height)
+        if self.instancing:
+            self.instancer.render(self.render_queue.sort(renderables))
+        else:
+            self.transform_pass.update(renderables)
+            self.render_queue.render(renderables)
+        self.static_batch.render()
+        self.backend.end_frame()
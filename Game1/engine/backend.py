@@ -0,0 +1,197 @@
+import os
+
+import numpy as np
+import pygame
+
+from OpenGL.GL import *
+from OpenGL.GLU import *
+from OpenGL.arrays import vbo
+
+
+__all__ = ['RenderBackend', 'NullBackend', 'GLBackend']
+
+
+class RenderBackend(object):
+    # Everything the engine submits for drawing goes through the current
+    # backend, behind GLState. The base class only counts what it is given.
+    current = None
+
+    def __init__(self):
+        self.frames = 0
+        self.draw_calls = 0
+        self.triangles = 0
+        self.last_draw_calls = 0
+        self.last_triangles = 0
+
+    def open(self, game):
+        pass
+
+    def close(self):
+        pass
+
+    def begin_frame(self):
+        self.last_draw_calls, self.last_triangles = \
+            self.draw_calls, self.triangles
+        self.draw_calls = self.triangles = 0
+
+    def end_frame(self):
+        self.frames += 1
+
+    def submitted(self, triangles):
+        self.draw_calls += 1
+        self.triangles += triangles
+
+    def enable(self, cap, enabled):
+        pass
+
+    def client_state(self, array, enabled):
+        pass
+
+    def color(self, color):
+        pass
+
+    def light(self, light_id, pname, value):
+        pass
+
+    def look_at(self, eye, target, up):
+        pass
+
+    def push_matrix(self, matrix):
+        pass
+
+    def push_transform(self, position, rotation, scale):
+        pass
+
+    def pop_matrix(self):
+        pass
+
+    def buffer(self, data, buffer=None):
+        return None
+
+    def draw_mesh(self, mesh):
+        self.submitted(len(mesh.indices) // 3)
+
+    def draw_buffer(self, buffer, first, count):
+        self.submitted(count // 3)
+
+    def draw_arrays(self, vertices, normals, indices):
+        self.submitted(len(indices) // 3)
+
+
+class NullBackend(RenderBackend):
+    # No window and no GL calls. pygame still gets a dummy display so that
+    # Input can poll events.
+    def open(self, game):
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        pygame.init()
+        pygame.display.set_mode((1, 1))
+
+    def close(self):
+        pygame.quit()
+
+
+class GLBackend(RenderBackend):
+    stride = 6 * 4
+
+    def open(self, game):
+        pygame.init()
+        size = game.width, game.height
+        game.screen = pygame.display.set_mode(size,
+                                              pygame.OPENGL | pygame.DOUBLEBUF)
+        pygame.display.set_caption(game.caption)
+        glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
+        glClearColor(0.5, 0.7, 1, 1)
+        glMatrixMode(GL_PROJECTION)
+        aspect = game.width / game.height
+        gluPerspective(game.fov, aspect, game.near, game.far)
+        glMatrixMode(GL_MODELVIEW)
+
+    def close(self):
+        pygame.quit()
+
+    def begin_frame(self):
+        super().begin_frame()
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+    def end_frame(self):
+        super().end_frame()
+        pygame.display.flip()
+
+    def enable(self, cap, enabled):
+        if enabled:
+            glEnable(cap)
+        else:
+            glDisable(cap)
+
+    def client_state(self, array, enabled):
+        if enabled:
+            glEnableClientState(array)
+        else:
+            glDisableClientState(array)
+
+    def color(self, color):
+        glColor4f(*color)
+
+    def light(self, light_id, pname, value):
+        glLightfv(light_id, pname, value)
+
+    def look_at(self, eye, target, up):
+        glLoadIdentity()
+        gluLookAt(*eye, *target, *up)
+
+    def push_matrix(self, matrix):
+        glPushMatrix()
+        glMultMatrixf(matrix)
+
+    def push_transform(self, position, rotation, scale):
+        glPushMatrix()
+        glTranslatef(*position)
+        if rotation != (0, 0, 0):
+            glRotatef(rotation[0], 1, 0, 0)
+            glRotatef(rotation[1], 0, 1, 0)
+            glRotatef(rotation[2], 0, 0, 1)
+        if scale != (1, 1, 1):
+            glScalef(*scale)
+
+    def pop_matrix(self):
+        glPopMatrix()
+
+    def buffer(self, data, buffer=None):
+        if buffer is None:
+            return vbo.VBO(data)
+        buffer.set_array(data)
+        return buffer
+
+    def pointers(self, buffer):
+        glVertexPointer(3, GL_FLOAT, self.stride, buffer)
+        glNormalPointer(GL_FLOAT, self.stride, buffer + 12)
+
+    def draw_mesh(self, mesh):
+        super().draw_mesh(mesh)
+        if mesh.buffer is None:
+            mesh.buffer = vbo.VBO(np.hstack((mesh.vertices, mesh.normals)))
+            mesh.index_buffer = vbo.VBO(mesh.indices,
+                                        target=GL_ELEMENT_ARRAY_BUFFER)
+        mesh.buffer.bind()
+        mesh.index_buffer.bind()
+        self.pointers(mesh.buffer)
+        glDrawElements(GL_TRIANGLES, len(mesh.indices), mesh.index_type,
+                       mesh.index_buffer)
+        mesh.index_buffer.unbind()
+        mesh.buffer.unbind()
+
+    def draw_buffer(self, buffer, first, count):
+        super().draw_buffer(buffer, first, count)
+        buffer.bind()
+        self.pointers(buffer)
+        glDrawArrays(GL_TRIANGLES, first, count)
+        buffer.unbind()
+
+    def draw_arrays(self, vertices, normals, indices):
+        super().draw_arrays(vertices, normals, indices)
+        glVertexPointer(3, GL_FLOAT, 0, vertices)
+        glNormalPointer(GL_FLOAT, 0, normals)
+        glDrawElements(GL_TRIANGLES, len(indices), GL_UNSIGNED_INT, indices)
+
+
+RenderBackend.current = GLBackend()
@@ -0,0 +1,91 @@
+import numpy as np
+
+from .backend import RenderBackend
+from .components import Component, Cube
+from .glstate import GLState
+from .physics import Rigidbody
+from .transforms import model_matrix, transform_points, transform_normals
+
+
+__all__ = ['StaticBatch']
+
+
+class StaticBatch(object):
+    def __init__(self):
+        self.cubes = []
+        self.groups = []
+        self.buffer = None
+        self.dirty = False
+
+    @staticmethod
+    def is_static(gameobject):
+        # Static collider and no component that could move it every frame
+        rigidbody = gameobject.get_component_by_type(Rigidbody)
+        if rigidbody is None or not rigidbody.is_static:
+            return False
+        return all(type(c).update is Component.update
+                   for c in gameobject.components)
+
+    def build(self, gameobjects):
+        self.clear()
+        for gameobject in gameobjects:
+            if self.is_static(gameobject):
+                for component in gameobject.components:
+                    if isinstance(component, Cube):
+                        self.add(component)
+        self.upload()
+
+    def add(self, cube):
+        cube.batch = self
+        self.cubes.append(cube)
+        self.dirty = True
+
+    def discard(self, cube):
+        if cube.batch is self:
+            cube.batch = None
+            self.cubes.remove(cube)
+            self.dirty = True
+
+    def clear(self):
+        for cube in self.cubes:
+            cube.batch = None
+        self.cubes = []
+        self.groups = []
+        self.dirty = True
+
+    def upload(self):
+        by_color = {}
+        for cube in self.cubes:
+            by_color.setdefault(cube.color, []).append(self.geometry(cube))
+        self.groups = []
+        chunks = []
+        first = 0
+        for color, geometry in by_color.items():
+            data = np.concatenate(geometry)
+            self.groups.append((color, first, len(data)))
+            chunks.append(data)
+            first += len(data)
+        if chunks:
+            data = np.concatenate(chunks).astype(np.float32)
+            self.buffer = RenderBackend.current.buffer(data, self.buffer)
+        self.dirty = False
+
+    @staticmethod
+    def geometry(cube):
+        gameobject = cube.gameobject
+        matrix = model_matrix(gameobject.position, gameobject.rotation,
+                              gameobject.scale)
+        mesh = cube.mesh
+        points = transform_points(matrix, mesh.vertices[mesh.indices])
+        normals = transform_normals(matrix, mesh.normals[mesh.indices])
+        return np.hstack((points, normals))
+
+    def render(self):
+        if self.dirty:
+            self.upload()
+        if not self.groups:
+            return
+        GLState.vertex_arrays()
+        for color, first, count in self.groups:
+            GLState.color(color)
+            RenderBackend.current.draw_buffer(self.buffer, first, count)
@@ -0,0 +1,25 @@
+__all__ = ['Commands']
+
+
+class Commands(object):
+    # Spawns and despawns requested during a frame, applied together at the
+    # end of Game.update so nothing changes under the update loop
+    spawns = []
+    despawns = {}
+
+    @classmethod
+    def spawn(cls, factory, *args, **kwargs):
+        cls.spawns.append((factory, args, kwargs))
+
+    @classmethod
+    def despawn(cls, gameobject):
+        cls.despawns[gameobject] = None
+
+    @classmethod
+    def flush(cls):
+        despawns, cls.despawns = cls.despawns, {}
+        for gameobject in despawns:
+            gameobject.remove()
+        spawns, cls.spawns = cls.spawns, []
+        for factory, args, kwargs in spawns:
+            factory(*args, **kwargs)
@@ -1,5 +1,9 @@
 from OpenGL.GL import *
-from OpenGL.GLU import *
+
+from .backend import RenderBackend
+from .glstate import GLState
+from .lod import Lod
+from .mesh import MeshRegistry
 
 
 __all__ = ['Component', 'Renderable', 'Cube', 'Sphere', 'Light', 'Camera']
@@ -7,6 +11,13 @@ __all__ = ['Component', 'Renderable', 'Cube', 'Sphere', 'Light', 'Camera']
 
 class Component(object):
     __slots__ = ['gameobject']
+    # Row in the component's ECS table, when it has one
+    _row = None
+    # Collider categories on_collide and on_collisions want to hear about;
+    # None means all
+    collides_with = None
+    # Numeric attributes a Snapshot saves and restores
+    saved = ()
 
     def start(self):
         pass
@@ -20,53 +31,60 @@ class Component(object):
     def on_collide(self, other, contacts):
         pass
 
+    def on_collisions(self, collisions):
+        pass
+
+    @classmethod
+    def overrides(cls, hook):
+        return getattr(cls, hook, None) is not getattr(Component, hook, None)
+
 
 class Renderable(Component):
-    __slots__ = ['color']
-    
+    __slots__ = ['color', 'matrix']
+    cullable = True
+    transformed = True
+
     def __init__(self, color):
         self.color = color
+        self.matrix = None
 
     def render(self):
-        pos = self.gameobject.position
-        rot = self.gameobject.rotation
-        scale = self.gameobject.scale
-        glPushMatrix()
-        glTranslatef(*pos)
-        if rot != (0, 0, 0):
-            glRotatef(rot[0], 1, 0, 0)
-            glRotatef(rot[1], 0, 1, 0)
-            glRotatef(rot[2], 0, 0, 1)
-        if scale != (1, 1, 1):
-            glScalef(*scale)
-        if self.color is not None:
-            glColor4f(*self.color)
+        backend = RenderBackend.current
+        if self.matrix is not None:
+            # Precomputed for this frame by TransformPass
+            backend.push_matrix(self.matrix)
+            self.matrix = None
+        else:
+            gameobject = self.gameobject
+            backend.push_transform(gameobject.position, gameobject.rotation,
+                                   gameobject.scale)
+        GLState.color(self.color)
         self._render()
-        glPopMatrix()
+        backend.pop_matrix()
 
     def _render(self):
         pass
 
 
 class Light(Renderable):
+    cullable = False
+    transformed = False
+
     def __init__(self, light_id, color=(1, 1, 1, 0),
                  constant_att=0.1, linear_att=0.05):
         self.light_id = light_id
-        self.enabled = False
         self.color = color
         self.constant_att = constant_att
         self.linear_att = linear_att
 
     def render(self):
-        if not self.enabled:
-            self.enabled = True
-            glEnable(self.light_id)
         light_id = self.light_id
+        GLState.enable(light_id)
         position = self.gameobject.position
-        glLightfv(light_id, GL_POSITION, position)
-        glLightfv(light_id, GL_DIFFUSE, self.color)
-        glLightfv(light_id, GL_CONSTANT_ATTENUATION, self.constant_att)
-        glLightfv(light_id, GL_LINEAR_ATTENUATION, self.linear_att)
+        GLState.light(light_id, GL_POSITION, position)
+        GLState.light(light_id, GL_DIFFUSE, self.color)
+        GLState.light(light_id, GL_CONSTANT_ATTENUATION, self.constant_att)
+        GLState.light(light_id, GL_LINEAR_ATTENUATION, self.linear_att)
 
 
 class Camera(Component):
@@ -77,48 +95,49 @@ class Camera(Component):
         self.dz = dz
         Camera.instance = self
 
-    def render(self):
+    def look_at(self):
         pos = self.gameobject.position
-        glLoadIdentity()
-        gluLookAt(pos[0], self.dy, self.dz,
-                  pos[0], pos[1], pos[2],
-                  0, 1, 0)
+        return (pos[0], self.dy, self.dz), pos, (0, 1, 0)
 
+    def render(self):
+        GLState.look_at(*self.look_at())
 
-class Cube(Renderable):
-    sides = ((0, 1, 2, 3), (3, 2, 7, 6), (6, 7, 5, 4),
-             (4, 5, 1, 0), (1, 5, 7, 2), (4, 0, 3, 6))
 
-    normals = ((0, 0, -1), (-1, 0, 0), (0, 0, 1),
-               (1, 0, 0), (0, 1, 0), (0, -1, 0))
-    
+class Cube(Renderable):
     def __init__(self, color, size):
         super().__init__(color)
-        x, y, z = map(lambda i: i/2, size)
-        self.vertices = (
-            (x, -y, -z), (x, y, -z),
-            (-x, y,-z), (-x, -y, -z),
-            (x, -y, z), (x, y, z),
-            (-x, -y, z), (-x, y,  z))
+        self.size = size
+        self.mesh = MeshRegistry.get('cube', size)
+        self.batch = None
+
+    def render(self):
+        if self.batch is None:
+            super().render()
+
+    def stop(self):
+        if self.batch is not None:
+            self.batch.discard(self)
 
     def _render(self):
-        glBegin(GL_QUADS)
-        for i, side in enumerate(Cube.sides):
-            glNormal3fv(Cube.normals[i])
-            for v in side:
-                glVertex3fv(self.vertices[v])
-        glEnd()
+        self.mesh.draw()
 
 
 class Sphere(Renderable):
     slices = 40
     stacks = 40
+    lod_levels = ((20, 20), (12, 12), (6, 6))
+    lod_pixels = (48, 16, 6)
     
     def __init__(self, radius, color):
         super().__init__(color)
         self.radius = radius
-        self.quadratic = gluNewQuadric()
+        levels = ((Sphere.slices, Sphere.stacks),) + Sphere.lod_levels
+        self.lod = Lod.get('sphere', radius, levels, Sphere.lod_pixels)
+        self.set_level(0)
+
+    def set_level(self, level):
+        self.level = level
+        self.mesh = self.lod.meshes[level]
 
     def _render(self):
-        gluSphere(self.quadratic, self.radius,
-                  Sphere.slices, Sphere.stacks)
+        self.mesh.draw()
@@ -0,0 +1,200 @@
+from collections import defaultdict
+from itertools import product
+from math import floor, hypot, radians, tan
+
+import numpy as np
+
+from .physics import BoxCollider, SphereCollider
+
+
+__all__ = ['Frustum', 'SpatialGrid', 'Culling']
+
+
+def look_at(eye, target, up):
+    eye = np.asarray(eye, dtype=np.float64)
+    f = np.asarray(target, dtype=np.float64) - eye
+    f /= np.linalg.norm(f)
+    s = np.cross(f, up)
+    s /= np.linalg.norm(s)
+    u = np.cross(s, f)
+    m = np.identity(4)
+    m[0, :3], m[1, :3], m[2, :3] = s, u, -f
+    m[:3, 3] = -m[:3, :3] @ eye
+    return m
+
+
+def perspective(fov, aspect, near, far):
+    f = 1 / tan(radians(fov) / 2)
+    m = np.zeros((4, 4))
+    m[0, 0] = f / aspect
+    m[1, 1] = f
+    m[2, 2] = (far + near) / (near - far)
+    m[2, 3] = 2 * far * near / (near - far)
+    m[3, 2] = -1
+    return m
+
+
+class Frustum(object):
+    # Corners are indexed by (x, y, z) bits; edges join corners one bit apart
+    edges = [(a, a | bit) for a in range(8) for bit in (1, 2, 4)
+             if not a & bit]
+
+    def __init__(self, eye, target, up, fov, aspect, near, far):
+        clip = perspective(fov, aspect, near, far) @ look_at(eye, target, up)
+        planes = np.array([clip[3] + clip[0], clip[3] - clip[0],
+                           clip[3] + clip[1], clip[3] - clip[1],
+                           clip[3] + clip[2], clip[3] - clip[2]])
+        planes /= np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+        self.normals = planes[:, :3]
+        self.offsets = planes[:, 3]
+        ndc = np.array([(x, y, z, 1) for z, y, x in product((-1, 1), repeat=3)])
+        corners = ndc @ np.linalg.inv(clip).T
+        self.corners = corners[:, :3] / corners[:, 3:]
+
+    def visible(self, centers, radii):
+        distances = centers @ self.normals.T + self.offsets
+        return (distances >= -radii[:, None]).all(axis=1)
+
+    def slab_bounds(self, zmin, zmax):
+        # XY bounds of the frustum clipped to zmin <= z <= zmax
+        corners = self.corners
+        points = [c for c in corners if zmin <= c[2] <= zmax]
+        for a, b in Frustum.edges:
+            p, q = corners[a], corners[b]
+            for z in (zmin, zmax):
+                if (p[2] - z) * (q[2] - z) < 0:
+                    points.append(p + (q - p) * (z - p[2]) / (q[2] - p[2]))
+        if not points:
+            return None
+        points = np.array(points)
+        (xmin, ymin), (xmax, ymax) = points[:, :2].min(0), points[:, :2].max(0)
+        return xmin, ymin, xmax, ymax
+
+
+class SpatialGrid(object):
+    def __init__(self, cell_size=8):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)
+        self.items = {}
+
+    def span(self, xmin, ymin, xmax, ymax):
+        size = self.cell_size
+        return product(range(floor(xmin / size), floor(xmax / size) + 1),
+                       range(floor(ymin / size), floor(ymax / size) + 1))
+
+    def insert(self, item, xmin, ymin, xmax, ymax):
+        self.remove(item)
+        cells = list(self.span(xmin, ymin, xmax, ymax))
+        for cell in cells:
+            self.cells[cell].add(item)
+        self.items[item] = cells
+
+    def remove(self, item):
+        for cell in self.items.pop(item, ()):
+            bucket = self.cells[cell]
+            bucket.discard(item)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, xmin, ymin, xmax, ymax):
+        found = set()
+        cells = self.cells
+        for cell in self.span(xmin, ymin, xmax, ymax):
+            if cell in cells:
+                found.update(cells[cell])
+        return found
+
+
+class Culling(object):
+    # Renderables on static bodies live in a spatial grid and are only
+    # re-inserted when their GameObject is moved; physics-driven ones are
+    # tested against the frustum every frame.
+    instance = None
+
+    def __init__(self, cell_size=8):
+        self.grid = SpatialGrid(cell_size)
+        self.pending = set()
+        self.always = []
+        self.dynamic = set()
+        self.spheres = {}
+        self.by_object = defaultdict(set)
+        self.zmin = self.zmax = 0
+        Culling.instance = self
+
+    @staticmethod
+    def bounding_radius(renderable):
+        mesh = getattr(renderable, 'mesh', None)
+        if mesh is not None:
+            radius = mesh.radius
+        else:
+            gameobject = renderable.gameobject
+            for component in gameobject.components:
+                if isinstance(component, BoxCollider):
+                    radius = hypot(*component.size) / 2
+                    break
+                if isinstance(component, SphereCollider):
+                    radius = component.radius
+                    break
+            else:
+                return None
+        return radius * max(map(abs, renderable.gameobject.scale))
+
+    def add(self, renderable):
+        self.pending.add(renderable)
+
+    def discard(self, renderable):
+        self.pending.discard(renderable)
+        self.dynamic.discard(renderable)
+        if renderable in self.always:
+            self.always.remove(renderable)
+        if renderable in self.spheres:
+            del self.spheres[renderable]
+            self.grid.remove(renderable)
+            renderables = self.by_object[renderable.gameobject]
+            renderables.discard(renderable)
+            if not renderables:
+                del self.by_object[renderable.gameobject]
+
+    def move(self, gameobject):
+        for renderable in self.by_object.get(gameobject, ()):
+            self.insert(renderable)
+
+    def insert(self, renderable):
+        radius = self.bounding_radius(renderable)
+        x, y, z = renderable.gameobject.position
+        self.spheres[renderable] = (x, y, z), radius
+        self.zmin = min(self.zmin, z - radius)
+        self.zmax = max(self.zmax, z + radius)
+        self.grid.insert(renderable, x - radius, y - radius,
+                         x + radius, y + radius)
+
+    def classify(self):
+        for renderable in self.pending:
+            if not renderable.cullable or \
+                    self.bounding_radius(renderable) is None:
+                self.always.append(renderable)
+            elif renderable.gameobject._body.is_static:
+                self.by_object[renderable.gameobject].add(renderable)
+                self.insert(renderable)
+            else:
+                self.dynamic.add(renderable)
+        self.pending.clear()
+
+    def visible(self, frustum):
+        if self.pending:
+            self.classify()
+        result = list(self.always)
+        bounds = frustum.slab_bounds(self.zmin, self.zmax)
+        candidates = list(self.grid.query(*bounds)) if bounds else []
+        if candidates:
+            centers = np.array([self.spheres[r][0] for r in candidates])
+            radii = np.array([self.spheres[r][1] for r in candidates])
+            mask = frustum.visible(centers, radii)
+            result += [r for r, v in zip(candidates, mask) if v]
+        dynamic = list(self.dynamic)
+        if dynamic:
+            centers = np.array([r.gameobject.position for r in dynamic])
+            radii = np.array([self.bounding_radius(r) for r in dynamic])
+            mask = frustum.visible(centers, radii)
+            result += [r for r, v in zip(dynamic, mask) if v]
+        return result
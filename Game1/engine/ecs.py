@@ -0,0 +1,129 @@
+import numpy as np
+
+from .components import Component
+
+
+__all__ = ['ArrayComponent', 'ComponentTable', 'TransformTable', 'ECS']
+
+
+def _grow(array):
+    grown = np.zeros((2 * len(array),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class TransformTable(object):
+    # Rotation about x and y, z and scale of every GameObject, one row each.
+    # Rows never move, so component tables can point at them; freed rows are
+    # handed out again.
+    def __init__(self, capacity=64):
+        self.rotation = np.zeros((capacity, 2))
+        self.z = np.zeros(capacity)
+        self.scale = np.ones((capacity, 3))
+        self.size = 0
+        self.free = []
+
+    def add(self, z=0, scale=(1, 1, 1)):
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == len(self.z):
+                self.rotation = _grow(self.rotation)
+                self.z = _grow(self.z)
+                self.scale = _grow(self.scale)
+            row = self.size
+            self.size += 1
+        self.rotation[row] = 0
+        self.z[row] = z
+        self.scale[row] = scale
+        return row
+
+    def remove(self, row):
+        self.free.append(row)
+
+
+class ComponentTable(object):
+    # Densely packed rows for one ArrayComponent type. Removing a component
+    # moves the last row into its place.
+    def __init__(self, cls, capacity=64):
+        self.cls = cls
+        self.components = []
+        self.entity = np.zeros(capacity, dtype=np.intp)
+        self.columns = {name: np.zeros(capacity) for name in cls.columns}
+
+    def __len__(self):
+        return len(self.components)
+
+    def __getitem__(self, name):
+        return self.columns[name][:len(self.components)]
+
+    @property
+    def entities(self):
+        # Transform rows of the GameObjects, aligned with the components
+        return self.entity[:len(self.components)]
+
+    def add(self, component):
+        row = len(self.components)
+        if row == len(self.entity):
+            self.entity = _grow(self.entity)
+            for name, column in self.columns.items():
+                self.columns[name] = _grow(column)
+        self.entity[row] = component.gameobject._row
+        for name, column in self.columns.items():
+            column[row] = getattr(component, name)
+        component._row = row
+        self.components.append(component)
+
+    def remove(self, component):
+        row = component._row
+        last = self.components.pop()
+        if last is not component:
+            end = len(self.components)
+            self.components[row] = last
+            last._row = row
+            self.entity[row] = self.entity[end]
+            for column in self.columns.values():
+                column[row] = column[end]
+        component._row = None
+
+
+class ArrayComponent(Component):
+    # A component whose state can live in a ComponentTable. ``columns`` names
+    # the float attributes copied into the table when the component is added;
+    # ``system`` then updates every instance of the type at once. Outside ECS
+    # mode it is an ordinary component and ``update`` is called as usual.
+    columns = ()
+
+    @classmethod
+    def system(cls, table, transforms, dt):
+        for component in list(table.components):
+            component.update(dt)
+
+
+class ECS(object):
+    # Structure-of-arrays storage. Must be enabled before any GameObject is
+    # created; objects then keep their transform in ``transforms``.
+    enabled = False
+    transforms = TransformTable()
+    tables = {}
+
+    @classmethod
+    def enable(cls):
+        cls.enabled = True
+
+    @classmethod
+    def add(cls, component):
+        table = cls.tables.get(type(component))
+        if table is None:
+            table = cls.tables[type(component)] = ComponentTable(type(component))
+        table.add(component)
+
+    @classmethod
+    def remove(cls, component):
+        cls.tables[type(component)].remove(component)
+
+    @classmethod
+    def run(cls, dt):
+        for table in list(cls.tables.values()):
+            if table.components:
+                table.cls.system(table, cls.transforms, dt)
@@ -0,0 +1,89 @@
+from OpenGL.GL import *
+
+from .backend import RenderBackend
+
+
+__all__ = ['GLState']
+
+
+class GLState(object):
+    # Remembers the GL state set through it and skips calls that would not
+    # change anything. Everything drawn between frames must restore the
+    # modelview matrix it found (push/pop), since the view is kept as well.
+    caps = {}
+    client = {}
+    lights = {}
+    current_color = None
+    view = None
+    view_serial = 0
+    issued = 0
+    skipped = 0
+    last_issued = 0
+    last_skipped = 0
+
+    @classmethod
+    def reset(cls):
+        cls.caps = {}
+        cls.client = {}
+        cls.lights = {}
+        cls.current_color = None
+        cls.view = None
+        cls.view_serial += 1
+
+    @classmethod
+    def new_frame(cls):
+        cls.last_issued, cls.last_skipped = cls.issued, cls.skipped
+        cls.issued = cls.skipped = 0
+
+    @classmethod
+    def _changed(cls, changed):
+        if changed:
+            cls.issued += 1
+        else:
+            cls.skipped += 1
+        return changed
+
+    @classmethod
+    def enable(cls, cap, enabled=True):
+        if cls._changed(cls.caps.get(cap) is not enabled):
+            cls.caps[cap] = enabled
+            RenderBackend.current.enable(cap, enabled)
+
+    @classmethod
+    def client_state(cls, array, enabled=True):
+        if cls._changed(cls.client.get(array) is not enabled):
+            cls.client[array] = enabled
+            RenderBackend.current.client_state(array, enabled)
+
+    @classmethod
+    def vertex_arrays(cls):
+        cls.client_state(GL_VERTEX_ARRAY)
+        cls.client_state(GL_NORMAL_ARRAY)
+
+    @classmethod
+    def color(cls, color):
+        if color is None:
+            return
+        color = tuple(color)
+        if cls._changed(color != cls.current_color):
+            cls.current_color = color
+            RenderBackend.current.color(color)
+
+    @classmethod
+    def light(cls, light_id, pname, value):
+        # GL_POSITION is stored in eye space, so it depends on the view too
+        if pname == GL_POSITION:
+            key = tuple(value), cls.view_serial
+        else:
+            key = value if isinstance(value, (int, float)) else tuple(value)
+        if cls._changed(cls.lights.get((light_id, pname)) != key):
+            cls.lights[light_id, pname] = key
+            RenderBackend.current.light(light_id, pname, value)
+
+    @classmethod
+    def look_at(cls, eye, target, up):
+        view = tuple(eye), tuple(target), tuple(up)
+        if cls._changed(view != cls.view):
+            cls.view = view
+            cls.view_serial += 1
+            RenderBackend.current.look_at(eye, target, up)
@@ -6,10 +6,31 @@ class Input(object):
     quit_flag = False
     keys = defaultdict(bool)
     keys_down = defaultdict(bool)
+    # When set, called with the frame number instead of polling pygame;
+    # returns the keys held during that frame
+    script = None
+    frame = 0
+
+    @classmethod
+    def reset(cls):
+        cls.quit_flag = False
+        cls.keys.clear()
+        cls.keys_down.clear()
+        cls.frame = 0
 
     @classmethod
     def update(cls):
         cls.keys_down.clear()
+        if cls.script is not None:
+            held = cls.script(cls.frame)
+            cls.frame += 1
+            for key in held:
+                if not cls.keys[key]:
+                    cls.keys_down[key] = True
+            cls.keys.clear()
+            for key in held:
+                cls.keys[key] = True
+            return
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 cls.quit_flag = True
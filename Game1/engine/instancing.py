@@ -0,0 +1,85 @@
+import numpy as np
+
+from .backend import RenderBackend
+from .glstate import GLState
+from .transforms import model_matrices
+
+
+__all__ = ['Instancer']
+
+
+class Instancer(object):
+    # The fixed-function pipeline has no per-instance attributes, so every
+    # group is expanded into world space in one NumPy pass and drawn with a
+    # single glDrawElements call. This also runs on software Mesa.
+    min_instances = 8
+
+    def __init__(self, min_instances=None):
+        if min_instances is not None:
+            self.min_instances = min_instances
+        self.indices = {}
+        self.draw_calls = 0
+
+    def render(self, renderables):
+        self.draw_calls = 0
+        groups = {}
+        for renderable in renderables:
+            if getattr(renderable, 'batch', None) is not None:
+                continue
+            mesh = getattr(renderable, 'mesh', None)
+            if mesh is None:
+                renderable.render()
+                self.draw_calls += 1
+            else:
+                key = mesh, renderable.color
+                groups.setdefault(key, []).append(renderable)
+        for (mesh, color), renderables in groups.items():
+            if len(renderables) < self.min_instances:
+                for renderable in renderables:
+                    renderable.render()
+                    self.draw_calls += 1
+            else:
+                self.draw_group(mesh, color, renderables)
+                self.draw_calls += 1
+
+    @staticmethod
+    def transforms(renderables):
+        count = len(renderables)
+        positions = np.empty((count, 3))
+        rotations = np.empty((count, 3))
+        scales = np.empty((count, 3))
+        for i, renderable in enumerate(renderables):
+            gameobject = renderable.gameobject
+            positions[i] = gameobject.position
+            rotations[i] = gameobject.rotation
+            scales[i] = gameobject.scale
+        return model_matrices(positions, rotations, scales)
+
+    def instance_indices(self, mesh, count):
+        stride = len(mesh.indices)
+        indices = self.indices.get(mesh)
+        if indices is None or len(indices) < count * stride:
+            if indices is not None:
+                count = max(count, 2 * len(indices) // stride)
+            offsets = np.arange(count, dtype=np.uint32) * len(mesh.vertices)
+            indices = (mesh.indices.astype(np.uint32)[None, :]
+                       + offsets[:, None]).ravel()
+            self.indices[mesh] = indices
+        return indices
+
+    def draw_group(self, mesh, color, renderables):
+        count = len(renderables)
+        indices = self.instance_indices(mesh, count)
+        indices = indices[:count * len(mesh.indices)]
+        matrices = self.transforms(renderables)
+        linear = matrices[:, :3, :3]
+        vertices = (np.einsum('nij,vj->nvi', linear, mesh.vertices)
+                    + matrices[:, None, :3, 3])
+        normals = np.einsum('nji,vj->nvi', np.linalg.pinv(linear),
+                            mesh.normals)
+        normals /= np.linalg.norm(normals, axis=2, keepdims=True) + 1e-12
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        normals = np.ascontiguousarray(normals, dtype=np.float32)
+        GLState.color(color)
+        GLState.vertex_arrays()
+        RenderBackend.current.draw_arrays(vertices, normals, indices)
@@ -0,0 +1,63 @@
+from math import radians, tan
+
+import numpy as np
+
+from .mesh import MeshRegistry
+
+
+__all__ = ['Lod', 'LodSelector']
+
+
+class Lod(object):
+    # Tessellation levels of one mesh, finest first. ``pixels[i]`` is the
+    # projected radius, in pixels, below which level i + 1 is used.
+    groups = {}
+
+    def __init__(self, shape, size, levels, pixels, hysteresis=0.15):
+        self.meshes = [MeshRegistry.get(shape, size, *args) for args in levels]
+        self.pixels = pixels
+        self.hysteresis = hysteresis
+
+    @classmethod
+    def get(cls, shape, size, levels, pixels):
+        key = shape, size, tuple(levels), tuple(pixels)
+        lod = cls.groups.get(key)
+        if lod is None:
+            lod = cls.groups[key] = cls(shape, size, levels, pixels)
+        return lod
+
+    def select(self, level, pixels):
+        # Only switch once the size is clearly past a threshold, so objects
+        # sitting near one don't flip between levels every frame
+        thresholds = self.pixels
+        while level > 0 and \
+                pixels > thresholds[level - 1] * (1 + self.hysteresis):
+            level -= 1
+        while level < len(thresholds) and \
+                pixels < thresholds[level] * (1 - self.hysteresis):
+            level += 1
+        return level
+
+
+class LodSelector(object):
+    def __init__(self):
+        self.switches = 0
+
+    def update(self, renderables, eye, fov, height):
+        self.switches = 0
+        renderables = [r for r in renderables
+                       if getattr(r, 'lod', None) is not None]
+        if not renderables:
+            return
+        positions = np.array([r.gameobject.position for r in renderables])
+        radii = np.array([r.lod.meshes[0].radius *
+                          max(map(abs, r.gameobject.scale))
+                          for r in renderables])
+        distances = np.linalg.norm(positions - eye, axis=1)
+        scale = height / (2 * tan(radians(fov) / 2))
+        pixels = radii * scale / np.maximum(distances, 1e-6)
+        for renderable, size in zip(renderables, pixels):
+            level = renderable.lod.select(renderable.level, size)
+            if level != renderable.level:
+                renderable.set_level(level)
+                self.switches += 1
@@ -0,0 +1,95 @@
+from math import cos, sin, pi
+
+import numpy as np
+
+from OpenGL.GL import *
+
+from .backend import RenderBackend
+from .glstate import GLState
+
+
+__all__ = ['Mesh', 'MeshRegistry']
+
+
+class Mesh(object):
+    __slots__ = ['vertices', 'normals', 'indices', 'radius',
+                 'buffer', 'index_buffer']
+
+    def __init__(self, vertices, normals, indices):
+        self.vertices = np.asarray(vertices, dtype=np.float32)
+        self.normals = np.asarray(normals, dtype=np.float32)
+        dtype = np.uint16 if len(self.vertices) <= 0xffff else np.uint32
+        self.indices = np.asarray(indices, dtype=dtype)
+        self.radius = float(np.linalg.norm(self.vertices, axis=1).max())
+        self.buffer = None
+        self.index_buffer = None
+
+    @property
+    def index_type(self):
+        if self.indices.dtype == np.uint16:
+            return GL_UNSIGNED_SHORT
+        return GL_UNSIGNED_INT
+
+    def draw(self):
+        GLState.vertex_arrays()
+        RenderBackend.current.draw_mesh(self)
+
+
+def cube(size):
+    x, y, z = (s / 2 for s in size)
+    corners = ((x, -y, -z), (x, y, -z), (-x, y, -z), (-x, -y, -z),
+               (x, -y, z), (x, y, z), (-x, -y, z), (-x, y, z))
+    sides = ((0, 1, 2, 3), (3, 2, 7, 6), (6, 7, 5, 4),
+             (4, 5, 1, 0), (1, 5, 7, 2), (4, 0, 3, 6))
+    normals = ((0, 0, -1), (-1, 0, 0), (0, 0, 1),
+               (1, 0, 0), (0, 1, 0), (0, -1, 0))
+    vertices = [corners[v] for side in sides for v in side]
+    indices = []
+    for i in range(0, len(vertices), 4):
+        indices += (i, i + 1, i + 2, i, i + 2, i + 3)
+    return Mesh(vertices, np.repeat(normals, 4, axis=0), indices)
+
+
+def sphere(radius, slices, stacks):
+    # Same layout as gluSphere: poles on the z axis
+    normals = []
+    for i in range(stacks + 1):
+        theta = pi * i / stacks
+        for j in range(slices + 1):
+            phi = 2 * pi * j / slices
+            normals.append((cos(phi) * sin(theta), sin(phi) * sin(theta),
+                            cos(theta)))
+    indices = []
+    row = slices + 1
+    for i in range(stacks):
+        for j in range(slices):
+            a = i * row + j
+            b = a + row
+            indices += (a, b, a + 1, a + 1, b, b + 1)
+    normals = np.array(normals)
+    return Mesh(normals * radius, normals, indices)
+
+
+class MeshRegistry(object):
+    builders = {'cube': cube, 'sphere': sphere}
+    meshes = {}
+
+    @classmethod
+    def get(cls, shape, size, *args):
+        if isinstance(size, (tuple, list)):
+            size = tuple(float(s) for s in size)
+        else:
+            size = float(size)
+        key = (shape, size) + args
+        mesh = cls.meshes.get(key)
+        if mesh is None:
+            mesh = cls.meshes[key] = cls.builders[shape](size, *args)
+        return mesh
+
+    @classmethod
+    def register(cls, shape, builder):
+        cls.builders[shape] = builder
+
+    @classmethod
+    def clear(cls):
+        cls.meshes.clear()
@@ -1,32 +1,33 @@
+import time
+from array import array
+
+import numpy as np
 import pymunk
+from pymunk import _chipmunk as cp
 
 from .components import Component
 
 
-__all__ = ['BoxCollider', 'SphereCollider', 'Physics', 'Rigidbody']
-
-
-def coll_handler(_, arbiter):
-    if len(arbiter.shapes) == 2:
-        obj1 = arbiter.shapes[0].gameobject
-        obj2 = arbiter.shapes[1].gameobject
-
-        obj1.collide(obj2, arbiter.contacts)
-        obj2.collide(obj1, arbiter.contacts)
-    return True
-
-
-space = pymunk.Space()
-space.gravity = 0, -10
-space.set_default_collision_handler(coll_handler)
+__all__ = ['BoxCollider', 'SphereCollider', 'CollisionEvents', 'Collisions',
+           'Hit', 'Interpolation', 'Physics', 'PhysicsWorld', 'Rigidbody']
 
 
 class Rigidbody(Component):
-    __slots__ = ['mass', 'is_static']
+    # category names the collision type of the shape; shapes only collide
+    # when their layers bitmasks share a bit. A dynamic body with
+    # can_sleep False is never put to sleep; one with idle_speed falls
+    # asleep once it has moved slower than that for the world's sleep time.
+    __slots__ = ['mass', 'is_static', 'category', 'layers', 'can_sleep',
+                 'idle_speed']
 
-    def __init__(self, mass=1, is_static=True):
+    def __init__(self, mass=1, is_static=True, category='default', layers=-1,
+                 can_sleep=True, idle_speed=None):
         self.mass = mass
         self.is_static = is_static
+        self.category = category
+        self.layers = layers
+        self.can_sleep = can_sleep
+        self.idle_speed = idle_speed
 
     def start(self):
         if not self.is_static:
@@ -34,23 +35,34 @@ class Rigidbody(Component):
             pos = self.gameobject._body.position
             body = pymunk.Body(self.mass, 1666)
             body.position = pos
+            body.gameobject = self.gameobject
+            body.can_sleep = self.can_sleep
+            body.idle_speed = self.idle_speed
             self.gameobject._body = body
 
     def add_shape_to_space(self, shape):
-        shape.collision_type = 1
+        world = self.gameobject.world
+        shape.collision_type = world.collision_type(self.category)
+        shape.layers = self.layers
         self.gameobject._shape = shape
         shape.gameobject = self.gameobject
         if self.is_static:
-            space.add(shape)
+            world.add(shape)
         else:
-            space.add(self.gameobject._body, shape)
+            world.add(self.gameobject._body, shape)
+        for component in self.gameobject.colliders + \
+                self.gameobject.batch_colliders:
+            world.listen(shape.collision_type, component.collides_with)
 
 
 class BoxCollider(Rigidbody):
     __slots__ = ['size']
 
-    def __init__(self, width, height, mass=1, is_static=True):
-        super().__init__(mass, is_static)
+    def __init__(self, width, height, mass=1, is_static=True,
+                 category='default', layers=-1, can_sleep=True,
+                 idle_speed=None):
+        super().__init__(mass, is_static, category, layers, can_sleep,
+                         idle_speed)
         self.size = width, height
 
     def start(self):
@@ -63,8 +75,11 @@ class BoxCollider(Rigidbody):
 class SphereCollider(Rigidbody):
     __slots__ = ['radius']
 
-    def __init__(self, radius, mass=1, is_static=True):
-        super(SphereCollider, self).__init__(mass, is_static)
+    def __init__(self, radius, mass=1, is_static=True,
+                 category='default', layers=-1, can_sleep=True,
+                 idle_speed=None):
+        super(SphereCollider, self).__init__(mass, is_static, category, layers,
+                                             can_sleep, idle_speed)
         self.radius = radius
 
     def start(self):
@@ -74,11 +89,530 @@ class SphereCollider(Rigidbody):
         self.add_shape_to_space(shape)
 
 
+class Collisions(object):
+    # Everything one GameObject touched during a step, one row per contact
+    # point. Normals point away from the receiving object; owners[i] is the
+    # index in others of the object touched at row i.
+    __slots__ = ['others', 'points', 'normals', 'owners']
+
+    def __init__(self, others, points, normals, owners):
+        self.others = others
+        self.points = points
+        self.normals = normals
+        self.owners = owners
+
+
+class Hit(object):
+    # The GameObject found by a raycast or nearest query, where it was found
+    # and the surface normal there
+    __slots__ = ['gameobject', 'point', 'normal', 'distance']
+
+    def __init__(self, gameobject, point, normal, distance):
+        self.gameobject = gameobject
+        self.point = point
+        self.normal = normal
+        self.distance = distance
+
+
+class CollisionEvents(object):
+    # Collisions reported during one step, kept until dispatch()
+    def __init__(self):
+        self.receivers = []
+        self.others = []
+        self.contacts = []
+        self.ends = []
+        self.points = array('d')
+        self.normals = array('d')
+
+    def add(self, receiver, other, contacts, sign):
+        self.receivers.append(receiver)
+        self.others.append(other)
+        self.contacts.append(contacts)
+        for contact in contacts:
+            point, normal = contact.position, contact.normal
+            self.points.extend((point.x, point.y))
+            self.normals.extend((sign * normal.x, sign * normal.y))
+        self.ends.append(len(self.points) // 2)
+
+    def dispatch(self):
+        for receiver, other, contacts in zip(self.receivers, self.others,
+                                             self.contacts):
+            receiver.collide(other, contacts)
+        batched = {}
+        for i, receiver in enumerate(self.receivers):
+            if receiver.batch_colliders:
+                batched.setdefault(receiver, []).append(i)
+        if not batched:
+            return
+        points = np.frombuffer(self.points).reshape(-1, 2)
+        normals = np.frombuffer(self.normals).reshape(-1, 2)
+        for receiver, events in batched.items():
+            rows = []
+            owners = []
+            for owner, i in enumerate(events):
+                start = self.ends[i - 1] if i else 0
+                rows.extend(range(start, self.ends[i]))
+                owners.extend([owner] * (self.ends[i] - start))
+            others = [self.others[i] for i in events]
+            receiver.collide_batch(Collisions(others, points[rows],
+                                              normals[rows],
+                                              np.array(owners, dtype=np.intp)))
+
+
+class PhysicsWorld(object):
+    # Contacts only reach Python for pairs of collision types that someone
+    # listens to; every other pair is handled entirely by Chipmunk.
+    # Bodies idle for sleep_time seconds fall asleep; None disables it.
+    def __init__(self, gravity=(0, -10), sleep_time=0.5, idle_speed=0):
+        self.space = pymunk.Space()
+        self.space.gravity = gravity
+        if sleep_time is not None:
+            self.space.sleep_time_threshold = sleep_time
+            self.space.idle_speed_threshold = idle_speed
+        self.insomniacs = set()
+        # Bodies with their own idle speed -> seconds spent below it
+        self.idle = {}
+        self.types = {'default': 0}
+        # Collision type -> types its colliders want, None meaning all
+        self.listeners = {}
+        self.handled = set()
+        # Filled during space.step(), handed to components by dispatch()
+        self.events = CollisionEvents()
+        # Static box shape -> the merged shape standing in for it
+        self.merged = {}
+        # Query results, valid until the next step or change to the space
+        self.queries = {}
+        # 'tree' until use_spatial_hash() replaces Chipmunk's BB trees
+        self.broadphase = 'tree'
+        self.hash_size = None
+
+    def collision_type(self, category):
+        ctype = self.types.get(category)
+        if ctype is None:
+            ctype = self.types[category] = len(self.types)
+            for listener, others in list(self.listeners.items()):
+                if others is None:
+                    self.watch(listener, ctype)
+        return ctype
+
+    def listen(self, ctype, categories=None):
+        if categories is None:
+            self.listeners[ctype] = None
+            for other in list(self.types.values()):
+                self.watch(ctype, other)
+            return
+        others = self.listeners.setdefault(ctype, set())
+        if others is None:
+            return
+        for category in categories:
+            other = self.collision_type(category)
+            others.add(other)
+            self.watch(ctype, other)
+
+    def listens(self, ctype, other):
+        if ctype not in self.listeners:
+            return False
+        others = self.listeners[ctype]
+        return others is None or other in others
+
+    def watch(self, a, b):
+        pair = min(a, b), max(a, b)
+        if pair not in self.handled:
+            self.handled.add(pair)
+            self.space.add_collision_handler(pair[0], pair[1],
+                                             begin=self.handle_collision)
+
+    def handle_collision(self, _, arbiter):
+        shape1, shape2 = arbiter.shapes
+        contacts = arbiter.contacts
+        point = contacts[0].position if contacts else None
+        obj1, obj2 = self.owner(shape1, point), self.owner(shape2, point)
+        type1, type2 = shape1.collision_type, shape2.collision_type
+        first = self.listens(type1, type2)
+        second = self.listens(type2, type1)
+        if first:
+            self.events.add(obj1, obj2, contacts, 1)
+        if second:
+            self.events.add(obj2, obj1, contacts, -1)
+        return True
+
+    def step(self, dt):
+        self.integrate(dt)
+        self.dispatch()
+
+    @staticmethod
+    def step_all(worlds, dt):
+        for world in worlds:
+            world.integrate(dt)
+        for world in worlds:
+            world.dispatch()
+
+    def integrate(self, dt):
+        for body in self.insomniacs:
+            body.activate()
+        self.space.step(dt)
+        self.queries.clear()
+        if self.idle:
+            self.settle(dt)
+
+    def settle(self, dt):
+        sleep_time = self.space.sleep_time_threshold
+        idle = self.idle
+        for body in idle:
+            if body.is_sleeping:
+                continue
+            if body.velocity.get_length() < body.idle_speed:
+                idle[body] += dt
+                if idle[body] >= sleep_time:
+                    idle[body] = 0
+                    body.sleep()
+            else:
+                idle[body] = 0
+
+    def dispatch(self):
+        events, self.events = self.events, CollisionEvents()
+        if events.receivers:
+            events.dispatch()
+
+    def bodies(self):
+        # Only dynamic bodies are added to the space
+        return self.space.bodies
+
+    def add(self, *objects):
+        self.space.add(*objects)
+        self.queries.clear()
+        for body in objects:
+            if not isinstance(body, pymunk.Body):
+                continue
+            if not getattr(body, 'can_sleep', True):
+                self.insomniacs.add(body)
+            if getattr(body, 'idle_speed', None) is not None:
+                self.idle[body] = 0
+
+    def remove(self, *objects):
+        for shape in objects:
+            if shape in self.merged:
+                self.unmerge(self.merged[shape])
+        self.space.remove(*objects)
+        self.queries.clear()
+        for body in objects:
+            self.insomniacs.discard(body)
+            self.idle.pop(body, None)
+
+    # Queries return GameObjects and are answered once per step: asking the
+    # same question again before the next step returns the cached result.
+    # Moving an object by hand does not invalidate them.
+    def cached(self, key, search, *args):
+        result = self.queries.get(key, self.queries)
+        if result is self.queries:
+            result = self.queries[key] = search(*args)
+        return result
+
+    def raycast(self, start, end, layers=-1, ignore=None):
+        # ignore is a GameObject whose shapes the ray passes through, such as
+        # the caster: a ray starting inside a shape hits it at distance 0
+        start, end = tuple(start), tuple(end)
+        return self.cached(('raycast', start, end, layers, ignore),
+                           self._raycast, start, end, layers, ignore)
+
+    def _raycast(self, start, end, layers, ignore):
+        if ignore is None:
+            info = self.space.segment_query_first(start, end, layers)
+        else:
+            hits = [info for info in self.space.segment_query(start, end,
+                                                              layers)
+                    if self.owner(info.shape, info.get_hit_point())
+                    is not ignore]
+            info = min(hits, key=lambda info: info.t) if hits else None
+        if info is None:
+            return None
+        point = info.get_hit_point()
+        return Hit(self.owner(info.shape, point), point, info.n,
+                   info.get_hit_distance())
+
+    def point_query(self, point, layers=-1):
+        point = tuple(point)
+        return self.cached(('point', point, layers), self._point_query,
+                           point, layers)
+
+    def _point_query(self, point, layers):
+        point = pymunk.Vec2d(point)
+        return tuple(self.owner(shape, point)
+                     for shape in self.space.point_query(point, layers))
+
+    def bb_query(self, left, bottom, right, top, layers=-1):
+        # Bounding boxes only, like Chipmunk's own bb query
+        return self.cached(('bb', left, bottom, right, top, layers),
+                           self._bb_query, left, bottom, right, top, layers)
+
+    def _bb_query(self, left, bottom, right, top, layers):
+        found = []
+        bb = pymunk.BB(left, bottom, right, top)
+        for shape in self.space.bb_query(bb, layers):
+            parts = getattr(shape, 'parts', None)
+            if parts is None:
+                found.append(shape.gameobject)
+            else:
+                found.extend(part[4] for part in parts
+                             if part[0] <= right and left <= part[2] and
+                             part[1] <= top and bottom <= part[3])
+        return tuple(found)
+
+    def nearest(self, point, max_distance, layers=-1):
+        point = tuple(point)
+        return self.cached(('nearest', point, max_distance, layers),
+                           self._nearest, point, max_distance, layers)
+
+    def _nearest(self, point, max_distance, layers):
+        info = self.space.nearest_point_query_nearest(point, max_distance,
+                                                      layers)
+        if info is None:
+            return None
+        hit = pymunk.Vec2d(info['point'])
+        distance = info['distance']
+        normal = (pymunk.Vec2d(point) - hit) / distance if distance else None
+        return Hit(self.owner(info['shape'], hit), hit, normal, distance)
+
+    def within(self, point, radius, layers=-1):
+        point = tuple(point)
+        return self.cached(('within', point, radius, layers), self._within,
+                           point, radius, layers)
+
+    def _within(self, point, radius, layers):
+        return tuple(self.owner(info['shape'], info['point'])
+                     for info in self.space.nearest_point_query(point, radius,
+                                                                layers))
+
+    @staticmethod
+    def owner(shape, point=None):
+        # The GameObject behind a shape; for a merged shape, the one whose
+        # box is closest to the point
+        parts = getattr(shape, 'parts', None)
+        if parts is None or point is None:
+            return shape.gameobject
+        return min(parts, key=lambda part: max(part[0] - point.x, 0,
+                                               point.x - part[2], 0) +
+                   max(part[1] - point.y, 0, point.y - part[3], 0))[4]
+
+    def merge_boxes(self, shapes):
+        # Replaces axis-aligned static boxes that overlap or touch and can
+        # be joined into one larger box. Only boxes with the same collision
+        # type, layers, group, sensor flag, friction and elasticity are
+        # joined.
+        self.unmerge_all()
+        groups = {}
+        for shape in shapes:
+            bb = shape.cache_bb()
+            box = [bb.left, bb.bottom, bb.right, bb.top, [shape]]
+            key = (shape.collision_type, shape.layers, shape.group,
+                   shape.sensor, shape.friction, shape.elasticity)
+            groups.setdefault(key, []).append(box)
+        for boxes in groups.values():
+            count = None
+            while count != len(boxes):
+                count = len(boxes)
+                # Join along x boxes spanning the same rows, then along y
+                # boxes spanning the same columns
+                boxes = self.join(boxes, 0, 1)
+                boxes = self.join(boxes, 1, 0)
+            for box in boxes:
+                if len(box[4]) > 1:
+                    self.merge(*box)
+
+    @staticmethod
+    def join(boxes, axis, other):
+        lo, hi, olo, ohi = axis, axis + 2, other, other + 2
+        rows = {}
+        for box in boxes:
+            key = round(box[olo], 6), round(box[ohi], 6)
+            rows.setdefault(key, []).append(box)
+        joined = []
+        for row in rows.values():
+            row.sort(key=lambda box: box[lo])
+            current = row[0]
+            for box in row[1:]:
+                if box[lo] <= current[hi] + 1e-6:
+                    current = list(current)
+                    current[hi] = max(current[hi], box[hi])
+                    current[4] = current[4] + box[4]
+                else:
+                    joined.append(current)
+                    current = box
+            joined.append(current)
+        return joined
+
+    def merge(self, left, bottom, right, top, sources):
+        body = pymunk.Body()
+        body.position = (left + right) / 2, (bottom + top) / 2
+        shape = pymunk.Poly.create_box(body, (right - left, top - bottom))
+        first = sources[0]
+        shape.collision_type = first.collision_type
+        shape.layers = first.layers
+        shape.group = first.group
+        shape.sensor = first.sensor
+        shape.friction = first.friction
+        shape.elasticity = first.elasticity
+        shape.gameobject = first.gameobject
+        shape.sources = sources
+        shape.parts = []
+        for source in sources:
+            bb = source.cache_bb()
+            shape.parts.append((bb.left, bb.bottom, bb.right, bb.top,
+                                source.gameobject))
+            self.merged[source] = shape
+        self.space.remove(*sources)
+        self.space.add(shape)
+        self.queries.clear()
+
+    def unmerge(self, shape):
+        # Puts the original shapes back, e.g. before one of them is removed
+        self.space.remove(shape)
+        for source in shape.sources:
+            del self.merged[source]
+        self.space.add(*shape.sources)
+
+    def unmerge_all(self):
+        for shape in set(self.merged.values()):
+            self.unmerge(shape)
+
+    def hash_size_for(self, shapes):
+        # A cell about twice the typical shape extent, and about ten cells
+        # per shape, as the Chipmunk docs suggest
+        extents = [max(bb.right - bb.left, bb.top - bb.bottom)
+                   for bb in (shape.cache_bb() for shape in shapes)]
+        dim = 2 * float(np.median(extents)) if extents else 1
+        return max(dim, 1e-3), max(10 * len(shapes), 1000)
+
+    def use_spatial_hash(self, dim=None, count=None):
+        # Chipmunk can not switch back to BB trees afterwards
+        if dim is None or count is None:
+            dim, count = self.hash_size_for(self.space.shapes)
+        cp.cpSpaceUseSpatialHash(self.space._space, dim, count)
+        self.broadphase = 'hash'
+        self.hash_size = dim, count
+
+    def tune_broadphase(self, steps=20, warmup=5, threshold=1000):
+        # Times a copy of the space with each broadphase and switches to the
+        # spatial hash if it steps faster. The copies start without cached
+        # contacts, so the first few steps are not timed. Small spaces keep
+        # the BB trees.
+        if self.broadphase != 'tree' or len(self.space.shapes) < threshold:
+            return self.broadphase
+        dim, count = self.hash_size_for(self.space.shapes)
+        times = []
+        for use_hash in (False, True):
+            space = self.copy_space()
+            if use_hash:
+                cp.cpSpaceUseSpatialHash(space._space, dim, count)
+            self.time_steps(space, warmup)
+            times.append(self.time_steps(space, steps))
+        if times[1] < times[0]:
+            self.use_spatial_hash(dim, count)
+        return self.broadphase
+
+    @staticmethod
+    def time_steps(space, steps, dt=1 / 60):
+        start = time.perf_counter()
+        for _ in range(steps):
+            space.step(dt)
+        return time.perf_counter() - start
+
+    def copy_space(self):
+        # Bodies and shapes only, without collision handlers
+        space = pymunk.Space()
+        space.gravity = self.space.gravity
+        space.sleep_time_threshold = self.space.sleep_time_threshold
+        space.idle_speed_threshold = self.space.idle_speed_threshold
+        bodies = {}
+        for body in self.space.bodies:
+            copy = bodies[body] = pymunk.Body(body.mass, body.moment)
+            copy.position = body.position
+            copy.velocity = body.velocity
+            copy.angle = body.angle
+            copy.angular_velocity = body.angular_velocity
+            space.add(copy)
+        for shape in self.space.shapes:
+            body = bodies.get(shape.body)
+            if body is None:
+                body = pymunk.Body()
+                body.position = shape.body.position
+                body.angle = shape.body.angle
+            if isinstance(shape, pymunk.Circle):
+                copy = pymunk.Circle(body, shape.radius, shape.offset)
+            elif isinstance(shape, pymunk.Segment):
+                copy = pymunk.Segment(body, shape.a, shape.b, shape.radius)
+            else:
+                copy = pymunk.Poly(body, list(shape.verts), shape.offset,
+                                   shape.radius)
+            copy.collision_type = shape.collision_type
+            copy.layers = shape.layers
+            copy.group = shape.group
+            copy.sensor = shape.sensor
+            copy.friction = shape.friction
+            copy.elasticity = shape.elasticity
+            space.add(copy)
+        return space
+
+
 class Physics(object):
+    # The world new GameObjects join; Game makes its own world current
+    world = None
+
     @classmethod
     def step(cls, dt):
-        space.step(dt)
+        cls.world.step(dt)
+
+    @classmethod
+    def bodies(cls):
+        return cls.world.bodies()
+
+    @classmethod
+    def add(cls, *objects):
+        cls.world.add(*objects)
 
     @classmethod
-    def remove(cls, body):
-        space.remove(body)
+    def remove(cls, *objects):
+        cls.world.remove(*objects)
+
+
+class Interpolation(object):
+    # Positions and angles of the dynamic bodies before the last step.
+    # apply() moves the bodies part of the way back for rendering and
+    # restore() puts the simulated state back afterwards. The angle is
+    # written to the cpBody struct like the position: cpBodySetAngle would
+    # wake the body and keep it from ever falling asleep. No step runs in
+    # between, so the stale rotation vector doesn't matter.
+    def __init__(self, world):
+        self.world = world
+        self.bodies = []
+        self.previous = None
+        self.current = None
+
+    @staticmethod
+    def state(bodies):
+        return np.array([(b.position.x, b.position.y, b.angle)
+                         for b in bodies]).reshape(-1, 3)
+
+    def record(self):
+        self.bodies = list(self.world.bodies())
+        self.previous = self.state(self.bodies)
+
+    def apply(self, alpha):
+        if not self.bodies:
+            return
+        self.current = self.state(self.bodies)
+        blended = self.previous + (self.current - self.previous) * alpha
+        for body, (x, y, angle) in zip(self.bodies, blended):
+            body.position = x, y
+            body._bodycontents.a = angle
+
+    def restore(self):
+        if self.current is None:
+            return
+        for body, (x, y, angle) in zip(self.bodies, self.current):
+            body.position = x, y
+            body._bodycontents.a = angle
+        self.current = None
+
+
+Physics.world = PhysicsWorld()
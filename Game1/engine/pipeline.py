@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from pymunk import Vec2d
+
+
+__all__ = ['BodyView', 'PhysicsPipeline']
+
+
+class BodyView(object):
+    # Stands in for a dynamic body while the worker steps the real one;
+    # reads the state captured at the last sync point
+    __slots__ = ['state', 'row']
+    is_static = False
+
+    @property
+    def position(self):
+        x, y, angle = self.state[self.row]
+        return Vec2d(x, y)
+
+    @property
+    def angle(self):
+        return self.state[self.row][2]
+
+
+class PhysicsPipeline(object):
+    # Steps physics on a worker thread while the main thread renders the
+    # previous step. capture() writes the state of every dynamic body as
+    # (x, y, angle) rows into the back buffer and swaps it to the
+    # front; between bind() and unbind() their GameObjects read the front
+    # buffer instead of the bodies.
+    def __init__(self, world):
+        self.world = world
+        self.executor = None
+        self.future = None
+        self.buffers = [[], []]
+        self.gameobjects = []
+        self.bodies = []
+        self.views = {}
+
+    def wait(self):
+        if self.future is not None:
+            self.future.result()
+            self.future = None
+            self.world.dispatch()
+
+    def capture(self):
+        bodies = self.world.bodies()
+        back = self.buffers[1]
+        back.clear()
+        for body in bodies:
+            # Read the cpBody struct directly; the properties cost more
+            state = body._bodycontents
+            position = state.p
+            back.append((position.x, position.y, state.a))
+        self.buffers.reverse()
+        gameobjects = self.gameobjects = [body.gameobject for body in bodies]
+        views = self.views
+        self.views = {g: views.get(g) or BodyView() for g in gameobjects}
+
+    def start(self, dt):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(1)
+        # Collisions wait in world.events until wait() dispatches them
+        self.future = self.executor.submit(self.world.integrate, dt)
+
+    def bind(self):
+        front = self.buffers[0]
+        self.bodies = [g._body for g in self.gameobjects]
+        for row, gameobject in enumerate(self.gameobjects):
+            view = self.views[gameobject]
+            view.state = front
+            view.row = row
+            gameobject._body = view
+
+    def unbind(self):
+        for gameobject, body in zip(self.gameobjects, self.bodies):
+            gameobject._body = body
+        self.bodies = []
+
+    def close(self):
+        self.wait()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,35 @@
+__all__ = ['Pool']
+
+
+class Pool(object):
+    # Keeps GameObjects built by ``factory`` for reuse. Inactive objects
+    # keep their components but are out of the space and of every loop.
+    # acquire() passes its arguments on to the object's reset().
+    def __init__(self, factory, size=0):
+        self.factory = factory
+        self.free = []
+        for _ in range(size):
+            self.free.append(self.create())
+
+    def create(self):
+        gameobject = self.factory()
+        gameobject.pool = self
+        gameobject.deactivate()
+        return gameobject
+
+    def acquire(self, *args, **kwargs):
+        gameobject = self.free.pop() if self.free else self.create()
+        gameobject.reset(*args, **kwargs)
+        gameobject.activate()
+        return gameobject
+
+    def release(self, gameobject):
+        if gameobject.active:
+            gameobject.deactivate()
+            self.free.append(gameobject)
+
+    def clear(self):
+        for gameobject in self.free:
+            gameobject.pool = None
+            gameobject.remove()
+        self.free = []
@@ -0,0 +1,26 @@
+__all__ = ['RenderQueue']
+
+
+class RenderQueue(object):
+    # Lights and other mesh-less renderables keep their order and go first;
+    # the rest are grouped by colour and mesh, so GLState can drop the
+    # repeated glColor calls between neighbours
+    def __init__(self):
+        self.draw_calls = 0
+
+    @staticmethod
+    def sort_key(renderable):
+        mesh = getattr(renderable, 'mesh', None)
+        color = renderable.color
+        if mesh is None:
+            return False, ()
+        return True, (color is not None, color or (), id(mesh))
+
+    def sort(self, renderables):
+        return sorted(renderables, key=RenderQueue.sort_key)
+
+    def render(self, renderables):
+        self.draw_calls = 0
+        for renderable in self.sort(renderables):
+            renderable.render()
+            self.draw_calls += 1
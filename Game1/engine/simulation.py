@@ -0,0 +1,20 @@
+from multiprocessing import get_context
+
+
+__all__ = ['simulate_many']
+
+
+def _simulate(args):
+    factory, frames, dt, script = args
+    return factory().simulate(frames, dt, script)
+
+
+def simulate_many(factory, scripts, frames, dt=1 / 60, processes=None):
+    # One headless run per script, spread over a process pool. Each run gets
+    # a fresh, spawned process, since the engine keeps its world in globals
+    # that a forked worker would inherit. factory and the scripts must be
+    # picklable.
+    jobs = [(factory, frames, dt, script) for script in scripts]
+    context = get_context('spawn')
+    with context.Pool(processes, maxtasksperchild=1) as pool:
+        return pool.map(_simulate, jobs, chunksize=1)
@@ -0,0 +1,118 @@
+from array import array
+
+from .commands import Commands
+from .ecs import ECS
+
+
+__all__ = ['Snapshot']
+
+
+# Body position, velocity, angle, angular velocity, force and torque, then z,
+# rotation about x and y and scale
+FIELDS = 15
+
+
+class Snapshot(object):
+    # State of every active GameObject, written into a float buffer that is
+    # reused by every save(). Each object takes FIELDS values followed by the
+    # ``saved`` attributes of its components, in component order.
+    # restore() brings the same objects back in place: it removes objects
+    # spawned since, reactivates the ones removed or pooled since, and
+    # puts back the components they had.
+    def __init__(self, capacity=1024):
+        self.buffer = array('d', bytes(8 * capacity))
+        self.size = 0
+        self.gameobjects = []
+        self.components = []
+        self.members = set()
+
+    def reserve(self, size):
+        if size > len(self.buffer):
+            self.buffer.extend(bytes(8 * max(size - len(self.buffer),
+                                             len(self.buffer))))
+
+    @staticmethod
+    def read(component, name):
+        if component._row is not None and name in component.columns:
+            table = ECS.tables[type(component)]
+            return table.columns[name][component._row]
+        return getattr(component, name)
+
+    @staticmethod
+    def write(component, name, value):
+        if component._row is not None and name in component.columns:
+            table = ECS.tables[type(component)]
+            table.columns[name][component._row] = value
+        else:
+            setattr(component, name, type(getattr(component, name))(value))
+
+    def save(self, gameobjects):
+        self.gameobjects = list(gameobjects)
+        self.members = set(self.gameobjects)
+        self.components = [list(g.components) for g in self.gameobjects]
+        read = self.read
+        i = 0
+        for gameobject, components in zip(self.gameobjects, self.components):
+            self.reserve(i + FIELDS + sum(len(c.saved) for c in components))
+            buffer = self.buffer
+            # Read the cpBody struct directly; the properties cost more
+            state = gameobject._body._bodycontents
+            _, _, z = gameobject.position
+            ax, ay, _ = gameobject.rotation
+            sx, sy, sz = gameobject.scale
+            buffer[i:i + FIELDS] = array('d', (
+                state.p.x, state.p.y, state.v.x, state.v.y, state.a, state.w,
+                state.f.x, state.f.y, state.t, z, ax, ay, sx, sy, sz))
+            i += FIELDS
+            for component in components:
+                for name in component.saved:
+                    buffer[i] = read(component, name)
+                    i += 1
+        self.size = i
+
+    def restore(self, gameobjects, world):
+        Commands.spawns = []
+        Commands.despawns = {}
+        for gameobject in list(gameobjects):
+            if gameobject not in self.members:
+                gameobject.remove()
+        write = self.write
+        buffer = self.buffer
+        i = 0
+        for gameobject, components in zip(self.gameobjects, self.components):
+            if not gameobject.active:
+                gameobject.revive()
+            if gameobject.components != components:
+                for component in list(gameobject.components):
+                    if component not in components:
+                        gameobject.remove_component(component)
+                for component in components:
+                    if component not in gameobject.components:
+                        gameobject.add_component(component)
+            x, y, vx, vy, angle, w, fx, fy, t, z, ax, ay, sx, sy, sz = \
+                buffer[i:i + FIELDS]
+            i += FIELDS
+            body = gameobject._body
+            if body.is_static:
+                if tuple(body.position) != (x, y):
+                    gameobject.position = x, y, z
+            else:
+                body.position = x, y
+                body.velocity = vx, vy
+                body.angle = angle
+                body.angular_velocity = w
+                body.force = fx, fy
+                body.torque = t
+            position = gameobject.position
+            if position[2] != z:
+                gameobject.position = x, y, z
+            # Only when changed: batched objects are rebuilt when they move
+            if gameobject.rotation != (ax, ay, angle):
+                gameobject.rotation = ax, ay, angle
+            if gameobject.scale != (sx, sy, sz):
+                gameobject.scale = sx, sy, sz
+            for component in components:
+                for name in component.saved:
+                    write(component, name, buffer[i])
+                    i += 1
+        world.queries.clear()
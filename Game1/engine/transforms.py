@@ -0,0 +1,107 @@
+from math import cos, sin, radians
+
+import numpy as np
+
+from .ecs import ECS
+
+
+__all__ = ['model_matrix', 'model_matrices', 'transform_points',
+           'transform_normals', 'TransformPass']
+
+
+def _rotation(angle, axis):
+    c, s = cos(radians(angle)), sin(radians(angle))
+    i, j = [k for k in range(3) if k != axis]
+    m = np.identity(4)
+    m[i, i] = m[j, j] = c
+    m[i, j] = -s if axis != 1 else s
+    m[j, i] = s if axis != 1 else -s
+    return m
+
+
+def model_matrix(position, rotation=(0, 0, 0), scale=(1, 1, 1)):
+    # Same order as Renderable.render: translate, rotate x/y/z, then scale
+    m = np.identity(4)
+    m[:3, 3] = position
+    for axis, angle in enumerate(rotation):
+        if angle:
+            m = m @ _rotation(angle, axis)
+    return m @ np.diag((scale[0], scale[1], scale[2], 1))
+
+
+def transform_points(matrix, points):
+    points = np.asarray(points, dtype=np.float64)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def transform_normals(matrix, normals):
+    normals = np.asarray(normals, dtype=np.float64) @ np.linalg.inv(matrix[:3, :3])
+    return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+
+def model_matrices(positions, rotations, scales):
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    angles = np.radians(np.asarray(rotations, dtype=np.float64).reshape(-1, 3))
+    scales = np.asarray(scales, dtype=np.float64).reshape(-1, 3)
+    c, s = np.cos(angles), np.sin(angles)
+    n = len(positions)
+    rx = np.zeros((n, 3, 3))
+    rx[:, 0, 0] = 1
+    rx[:, 1, 1] = rx[:, 2, 2] = c[:, 0]
+    rx[:, 1, 2] = -s[:, 0]
+    rx[:, 2, 1] = s[:, 0]
+    ry = np.zeros((n, 3, 3))
+    ry[:, 1, 1] = 1
+    ry[:, 0, 0] = ry[:, 2, 2] = c[:, 1]
+    ry[:, 0, 2] = s[:, 1]
+    ry[:, 2, 0] = -s[:, 1]
+    rz = np.zeros((n, 3, 3))
+    rz[:, 2, 2] = 1
+    rz[:, 0, 0] = rz[:, 1, 1] = c[:, 2]
+    rz[:, 0, 1] = -s[:, 2]
+    rz[:, 1, 0] = s[:, 2]
+    m = np.zeros((n, 4, 4))
+    m[:, :3, :3] = rx @ ry @ rz * scales[:, None, :]
+    m[:, :3, 3] = positions
+    m[:, 3, 3] = 1
+    return m
+
+
+class TransformPass(object):
+    # Gathers the transforms of every renderable drawn this frame and
+    # computes their model matrices in one go; each one then needs a single
+    # glMultMatrixf instead of a translate/rotate/scale sequence
+    def __init__(self):
+        self.count = 0
+
+    def update(self, renderables):
+        renderables = [r for r in renderables if r.transformed and
+                       getattr(r, 'batch', None) is None]
+        self.count = len(renderables)
+        if not renderables:
+            return
+        bodies = [r.gameobject._body for r in renderables]
+        gameobjects = [r.gameobject for r in renderables]
+        positions = [body.position for body in bodies]
+        if ECS.enabled:
+            # Everything but the body state is already in the table
+            rows = [g._row for g in gameobjects]
+            table = ECS.transforms
+            positions = np.column_stack((
+                [(p.x, p.y) for p in positions], table.z[rows]))
+            rotations = np.column_stack((
+                table.rotation[rows], [body.angle for body in bodies]))
+            scales = table.scale[rows]
+        else:
+            positions = np.array([(p.x, p.y, g._z)
+                                  for p, g in zip(positions, gameobjects)])
+            rotations = np.array([(g._ax, g._ay, body.angle)
+                                  for g, body in zip(gameobjects, bodies)])
+            scales = np.array([g.scale for g in gameobjects],
+                              dtype=np.float64)
+        matrices = model_matrices(positions, rotations, scales)
+        # GL expects column-major matrices
+        matrices = np.ascontiguousarray(matrices.transpose(0, 2, 1),
+                                        dtype=np.float32)
+        for renderable, matrix in zip(renderables, matrices):
+            renderable.matrix = matrix
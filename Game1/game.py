@@ -1,3 +1,6 @@
+import sys
+
+import numpy as np
 from pygame.locals import *
 from engine import *
 
@@ -7,10 +10,11 @@ class Platform(GameObject):
         super().__init__(x, y)
         color = (0.47, 0.47, 0.47, 0.47)
         self.add_components(Cube(color, size=(width, height, 2)),
-                            BoxCollider(width, height))
+                            BoxCollider(width, height, category='ground'))
 
 
-class Rotating(Component):
+class Rotating(ArrayComponent):
+    columns = ('speed',)
     speed = 50
 
     def update(self, dt):
@@ -18,6 +22,12 @@ class Rotating(Component):
         ay = (ay + self.speed * dt) % 360
         self.gameobject.rotation = ax, ay, az
 
+    @classmethod
+    def system(cls, table, transforms, dt):
+        rows = table.entities
+        angles = transforms.rotation[rows, 1] + table['speed'] * dt
+        transforms.rotation[rows, 1] = angles % 360
+
 
 class Pickup(GameObject):
     def __init__(self, x, y):
@@ -25,38 +35,64 @@ class Pickup(GameObject):
         self.tag = 'pickup'
         color = (1, 1, 0.5, 1)
         self.add_components(Cube(color, size=(1, 1, 1)),
-                            Rotating(), BoxCollider(1, 1))
+                            Rotating(), BoxCollider(1, 1, category='pickup'))
 
 
-class Disappear(Component):
+class Disappear(ArrayComponent):
     def update(self, dt):
         self.gameobject.velocity = 0, 0
         s1, s2, s3 = map(lambda s: s - dt*2, self.gameobject.scale)
         self.gameobject.scale = s1, s2, s3
-        if s1 <= 0: self.gameobject.remove()
+        if s1 <= 0: self.gameobject.despawn()
+
+    @classmethod
+    def system(cls, table, transforms, dt):
+        for component in table.components:
+            component.gameobject.velocity = 0, 0
+        rows = table.entities
+        # An object can be given more than one Disappear; each one shrinks it
+        np.subtract.at(transforms.scale, rows, dt*2)
+        for i in np.flatnonzero(transforms.scale[rows, 0] <= 0):
+            table.components[i].gameobject.despawn()
 
 
 class Shoot(Component):
     def on_collide(self, other, contacts):
-        self.gameobject.remove()
+        self.gameobject.despawn()
+
+
+class Projectile(GameObject):
+    def __init__(self):
+        super().__init__()
+        self.tag = 'shoot'
+        self.add_components(Sphere(0.3, (1, 1, 0, 1)), Shoot(),
+                            SphereCollider(0.3, mass=0.1, is_static=False,
+                                           category='shoot'))
+
+    def reset(self, x, y, direction):
+        super().reset(x, y)
+        self.apply_force(20 * direction, 0)
 
 
 class Shooter(Component):
-    __slots__ = ['ammo']
+    __slots__ = ['ammo', 'projectiles']
+    collides_with = 'pickup',
+    saved = 'ammo',
 
     def __init__(self):
         self.ammo = 0
+        self.projectiles = None
+
+    def start(self):
+        self.projectiles = Pool(Projectile, 8)
 
     def update(self, dt):
         if Input.get_key_down(K_SPACE) and self.ammo > 0:
             self.ammo -= 1
             direction = 1 if self.gameobject.velocity.x > 0 else -1
             pos = self.gameobject.position
-            shoot = GameObject(pos[0] + 1.5 * direction, pos[1])
-            shoot.tag = 'shoot'
-            shoot.add_components(Sphere(0.3, (1, 1, 0, 1)), Shoot(),
-                                 SphereCollider(0.3, mass=0.1, is_static=False))
-            shoot.apply_force(20 * direction, 0)
+            Commands.spawn(self.projectiles.acquire, pos[0] + 1.5 * direction,
+                           pos[1], direction)
 
     def on_collide(self, other, contacts):
         if other.tag == 'pickup':
@@ -65,6 +101,8 @@ class Shooter(Component):
 
 
 class Shootable(Component):
+    collides_with = 'shoot',
+
     def on_collide(self, other, contacts):
         if other.tag == 'shoot':
             self.gameobject.add_component(Disappear())
@@ -75,15 +113,19 @@ class Enemy(GameObject):
         super().__init__(x, y)
         self.tag = 'enemy'
         color = (0.2, 1, 0.5, 1)
-        # self.add_components(Sphere(1, color), Shootable(), SphereCollider(1, is_static=False))
-        self.add_components(Cube(color, size=(2, 2, 2)), SphereCollider(1, is_static=False))
+        # self.add_components(Sphere(1, color), Shootable(), SphereCollider(1, is_static=False, category='enemy'))
+        self.add_components(Cube(color, size=(2, 2, 2)),
+                            SphereCollider(1, is_static=False, category='enemy'))
 
 class Respawn(Component):
-    __slots__ = ['limit', 'spawn_position']
+    __slots__ = ['limit', 'spawn_position', 'respawns']
+    collides_with = 'enemy',
+    saved = 'respawns',
 
     def __init__(self, limit=-15):
         self.limit = limit
         self.spawn_position = None
+        self.respawns = 0
 
     def start(self):
         self.spawn_position = self.gameobject.position
@@ -97,25 +139,26 @@ class Respawn(Component):
             self.respawn()
 
     def respawn(self):
+        self.respawns += 1
         self.gameobject.velocity = 0, 0
         self.gameobject.position = self.spawn_position
 
 
 class PlayerMovement(Component):
-    __slots__ = ['can_jump']
-
-    def __init__(self):
-        self.can_jump = False
-
     def update(self, dt):
         d = Input.get_key(K_RIGHT) - Input.get_key(K_LEFT)
         self.gameobject.move(d * 5 * dt, 0)
-        if Input.get_key(K_UP) and self.can_jump:
-            self.can_jump = False
+        if Input.get_key(K_UP) and self.can_jump():
             self.gameobject.move(0, 8)
 
-    def on_collide(self, other, contacts):
-        self.can_jump = any(c.normal.y < 0 for c in contacts)
+    def can_jump(self):
+        # Not already going up, and anything but us just below the sphere
+        gameobject = self.gameobject
+        if gameobject.velocity.y > 1:
+            return False
+        x, y, _ = gameobject.position
+        return gameobject.world.raycast((x, y), (x, y - 1.1),
+                                        ignore=gameobject) is not None
 
 
 class Player(GameObject):
@@ -124,12 +167,13 @@ class Player(GameObject):
         self.add_components(Sphere(1, (1, 1, 1, 1)),
                             PlayerMovement(), Respawn(),
                             Shooter(), Camera(10, 20),
-                            SphereCollider(1, is_static=False))
+                            SphereCollider(1, is_static=False,
+                                           category='player', can_sleep=False))
 
 
 class PyPlatformer(Game):
-    def __init__(self):
-        super().__init__('PyPlatformer')
+    def __init__(self, ecs=False):
+        super().__init__('PyPlatformer', ecs=ecs)
         self.player = Player(-2, 0)
         self.light = GameObject(0, 10, 0)
         self.light.add_component(Light(GL_LIGHT0))
@@ -149,7 +193,30 @@ class PyPlatformer(Game):
         # self.pickups = Pickup(60, 5)
         self.enemies = [Enemy(40, 4), Enemy(90, 6)]
 
+    def metrics(self):
+        x, y, _ = self.player.position
+        return {'x': x, 'y': y,
+                'respawns': self.player.get_component_by_type(Respawn).respawns,
+                'ammo': self.player.get_component_by_type(Shooter).ammo,
+                'enemies': len(GameObject.find_with_tag('enemy'))}
+
+
+class RunAndJump(object):
+    # Scripted input for headless runs: hold right, jump every period frames
+    def __init__(self, period):
+        self.period = period
+
+    def __call__(self, frame):
+        if frame % self.period == 0:
+            return K_RIGHT, K_UP
+        return K_RIGHT,
+
 
 if __name__ == '__main__':
-    game = PyPlatformer()
-    game.mainloop()
+    if '--headless' in sys.argv:
+        scripts = [RunAndJump(period) for period in range(10, 90, 5)]
+        for metrics in simulate_many(PyPlatformer, scripts, frames=3600):
+            print(metrics)
+    else:
+        game = PyPlatformer()
+        game.mainloop()
@@ -4,6 +4,7 @@ import pygame
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
+from text import TextRenderer
 
 gravity = -0.02
 TIMEEVENT = pygame.USEREVENT + 1
@@ -141,7 +142,7 @@ class App(object):
         self.height = height
         self.game_over = False
         self.random_dt = 0
-        self.textdata = ""
+        self.text = TextRenderer()
         self.blocks = []
         # timer variables
         self.milliseconds = 0
@@ -211,11 +212,7 @@ class App(object):
         pygame.display.flip()
 
     def drawtext(self, text, position, size):
-        font = pygame.font.Font(None, size)
-        textSurface = font.render(text, True, (255, 255, 255, 255), (104, 104, 104, 104))
-        self.textdata = pygame.image.tostring(textSurface, "RGBA", True)
-        glRasterPos3d(*position)
-        glDrawPixels(textSurface.get_width(), textSurface.get_height(), GL_RGBA, GL_UNSIGNED_BYTE, self.textdata)
+        self.text.draw(text, position, size)
 
     def process_events(self):
         for event in pygame.event.get():
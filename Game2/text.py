@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import pygame
+from OpenGL.GL import *
+
+
+class GlyphAtlas(object):
+    first = 32
+    last = 127
+    width = 512
+
+    def __init__(self, size, font=None, color=(255, 255, 255)):
+        self.font = pygame.font.Font(font, size)
+        self.height = self.font.get_height()
+        glyphs = [(chr(c), self.font.render(chr(c), True, color))
+                  for c in range(self.first, self.last)]
+        # Pack the glyphs in rows, then round the height up to a power of two
+        self.rects = {}
+        x = y = 0
+        for char, surface in glyphs:
+            w = surface.get_width()
+            if x + w > self.width:
+                x = 0
+                y += self.height + 1
+            self.rects[char] = (x, y, w, surface.get_height())
+            x += w + 1
+        height = 1
+        while height < y + self.height:
+            height *= 2
+        atlas = pygame.Surface((self.width, height), pygame.SRCALPHA)
+        atlas.fill((0, 0, 0, 0))
+        for char, surface in glyphs:
+            atlas.blit(surface, self.rects[char][:2])
+        self.texture_height = height
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.width, height, 0,
+                     GL_RGBA, GL_UNSIGNED_BYTE,
+                     pygame.image.tostring(atlas, "RGBA", True))
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def layout(self, text):
+        vertices = []
+        texcoords = []
+        x = 0
+        for char in text:
+            if char not in self.rects:
+                char = '?'
+            u, v, w, h = self.rects[char]
+            u0 = u / self.width
+            u1 = (u + w) / self.width
+            # The texture was uploaded bottom row first
+            top = 1 - v / self.texture_height
+            bottom = 1 - (v + h) / self.texture_height
+            vertices += [x, 0, x + w, 0, x + w, h, x, h]
+            texcoords += [u0, bottom, u1, bottom, u1, top, u0, top]
+            x += w
+        return TextMesh(vertices, texcoords, x, self.height)
+
+
+class TextMesh(object):
+    def __init__(self, vertices, texcoords, width, height):
+        self.count = len(vertices) // 2
+        self.vertices = (GLfloat * len(vertices))(*vertices)
+        self.texcoords = (GLfloat * len(texcoords))(*texcoords)
+        self.width = width
+        self.height = height
+
+
+class TextRenderer(object):
+    cache_size = 32
+
+    def __init__(self, font=None, background=(104, 104, 104)):
+        self.font = font
+        self.background = tuple(c / 255 for c in background)
+        self.atlases = {}
+        self.strings = OrderedDict()
+
+    def atlas(self, size):
+        if size not in self.atlases:
+            self.atlases[size] = GlyphAtlas(size, self.font)
+        return self.atlases[size]
+
+    def mesh(self, text, size):
+        key = text, size
+        mesh = self.strings.get(key)
+        if mesh is None:
+            mesh = self.strings[key] = self.atlas(size).layout(text)
+            if len(self.strings) > self.cache_size:
+                self.strings.popitem(last=False)
+        else:
+            self.strings.move_to_end(key)
+        return mesh
+
+    def draw(self, text, position, size):
+        mesh = self.mesh(text, size)
+        atlas = self.atlas(size)
+        # Anchor the text where glDrawPixels would have put it
+        glRasterPos3d(*position)
+        x, y = glGetFloatv(GL_CURRENT_RASTER_POSITION)[:2]
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        glPushAttrib(GL_ENABLE_BIT | GL_CURRENT_BIT | GL_COLOR_BUFFER_BIT)
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, viewport[2], 0, viewport[3], -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glTranslatef(round(x), round(y), 0)
+        glDisable(GL_LIGHTING)
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_CULL_FACE)
+        glColor3f(*self.background)
+        glRectf(0, 0, mesh.width, mesh.height)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, atlas.texture)
+        glColor4f(1, 1, 1, 1)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, mesh.vertices)
+        glTexCoordPointer(2, GL_FLOAT, 0, mesh.texcoords)
+        glDrawArrays(GL_QUADS, 0, mesh.count)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glPopClientAttrib()
+        glPopAttrib()